@@ -0,0 +1,63 @@
+"""price history
+
+Revision ID: 3c9e4f2a7b1d
+Revises: 8dd251168ad0
+Create Date: 2026-10-18 10:12:41.503217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e4f2a7b1d'
+down_revision: Union[str, None] = '8dd251168ad0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('price', sa.Numeric(10, 2), nullable=True))
+    op.add_column('products', sa.Column('currency', sa.String(3), nullable=True))
+    op.add_column('products', sa.Column('promo_text', sa.String(), nullable=True))
+
+    # Backfill the numeric price from the first dollar amount of the existing price texts
+    op.execute(r"""
+        UPDATE products
+        SET price = replace(substring(last_seen_price from '\$\s*([0-9][0-9,]*(?:\.[0-9]{1,2})?)'), ',', '')::numeric(10, 2),
+            currency = 'USD'
+        WHERE last_seen_price ~ '\$\s*[0-9]'
+    """)
+
+    op.create_table(
+        'price_observations',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('observed_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.Column('price', sa.Numeric(10, 2), nullable=True),
+        sa.Column('currency', sa.String(3), nullable=True),
+        sa.Column('promo_text', sa.String(), nullable=True),
+        sa.Column('in_stock', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    # Append-only and time ordered: BRIN for time ranges, btree for per-product history
+    op.create_index('ix_price_observations_observed_at', 'price_observations', ['observed_at'], postgresql_using='brin')
+    op.create_index('ix_price_observations_product_observed_at', 'price_observations', ['product_id', 'observed_at'])
+
+    # Seed the history with the current state so the first comparisons have a baseline
+    op.execute("""
+        INSERT INTO price_observations (product_id, observed_at, price, currency, in_stock)
+        SELECT id, updated_date, price, currency, in_stock FROM products
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_price_observations_product_observed_at', table_name='price_observations')
+    op.drop_index('ix_price_observations_observed_at', table_name='price_observations')
+    op.drop_table('price_observations')
+    op.drop_column('products', 'promo_text')
+    op.drop_column('products', 'currency')
+    op.drop_column('products', 'price')
@@ -0,0 +1,57 @@
+"""flip opportunities
+
+Revision ID: 7f1d2c8e9a40
+Revises: 3c9e4f2a7b1d
+Create Date: 2026-10-18 11:03:17.284915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f1d2c8e9a40'
+down_revision: Union[str, None] = '3c9e4f2a7b1d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'flip_opportunities',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('amazon_product_id', sa.Integer(), nullable=False),
+        sa.Column('source', sa.String(), nullable=False),
+        sa.Column('product_url', sa.String(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('price', sa.Numeric(10, 2), nullable=True),
+        sa.Column('asin', sa.String(), nullable=False),
+        sa.Column('amazon_url', sa.String(), nullable=False),
+        sa.Column('amazon_buy_box_count', sa.Integer(), nullable=False),
+        sa.Column('current_sellers', sa.Integer(), nullable=False),
+        sa.Column('updated_date', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['amazon_product_id'], ['amazon_products.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id', 'amazon_product_id'),
+    )
+    op.create_index('ix_flip_opportunities_rank', 'flip_opportunities', ['amazon_buy_box_count', sa.text('product_id DESC')])
+    op.create_index('ix_flip_opportunities_amazon_product_id', 'flip_opportunities', ['amazon_product_id'])
+
+    # Initial fill, app/opportunities.py keeps it current from here on
+    op.execute("""
+        INSERT INTO flip_opportunities
+            (product_id, amazon_product_id, source, product_url, title, price, asin, amazon_url, amazon_buy_box_count, current_sellers)
+        SELECT p.id, a.id, p.source, p.product_url, p.title, p.price, a.asin, a.product_url, a.amazon_buy_box_count, a.current_sellers
+        FROM products p
+        JOIN product_matches m ON m.product_id = p.id
+        JOIN amazon_products a ON a.id = m.amazon_product_id
+        WHERE p.in_stock AND a.amazon_buy_box_count < 45 AND a.current_sellers > 2
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_flip_opportunities_amazon_product_id', table_name='flip_opportunities')
+    op.drop_index('ix_flip_opportunities_rank', table_name='flip_opportunities')
+    op.drop_table('flip_opportunities')
@@ -0,0 +1,42 @@
+"""hot filter indexes
+
+Revision ID: b52e6a1f0c93
+Revises: 7f1d2c8e9a40
+Create Date: 2026-10-18 11:48:05.917342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b52e6a1f0c93'
+down_revision: Union[str, None] = '7f1d2c8e9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Report: newest in-stock products first
+    op.create_index('ix_products_in_stock_id', 'products', [sa.text('id DESC')], postgresql_where=sa.text('in_stock'))
+    # Scrape runs load every product of a source, served by an index-only scan
+    op.create_index('ix_products_source', 'products', ['source'], postgresql_include=['id', 'product_url', 'last_seen_price', 'in_stock'])
+    # Keepa enrichment pages by id over the products not analyzed yet
+    op.create_index(
+        'ix_amazon_products_unanalyzed', 'amazon_products', ['id'], postgresql_include=['asin'],
+        postgresql_where=sa.text('amazon_buy_box_count IS NULL OR amazon_buy_box_count = -1'),
+    )
+    # Buy box / sellers thresholds of the opportunity queries
+    op.create_index('ix_amazon_products_buy_box_sellers', 'amazon_products', ['amazon_buy_box_count', 'current_sellers'])
+    # Amazon side of product_matches, ix_product_amazon_match only serves lookups by product_id
+    op.create_index('ix_product_matches_amazon_product_id', 'product_matches', ['amazon_product_id', 'product_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_product_matches_amazon_product_id', table_name='product_matches')
+    op.drop_index('ix_amazon_products_buy_box_sellers', table_name='amazon_products')
+    op.drop_index('ix_amazon_products_unanalyzed', table_name='amazon_products')
+    op.drop_index('ix_products_source', table_name='products')
+    op.drop_index('ix_products_in_stock_id', table_name='products')
@@ -0,0 +1,167 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+from .readiness import wait_for_element
+
+logger = logging.getLogger(__name__)
+
+# Chrome started with --remote-debugging-port, shared by every attached driver
+CHROME_DEBUGGER_ADDRESS = os.getenv('CHROME_DEBUGGER_ADDRESS', 'localhost:9222')
+
+
+# Attach a new WebDriver session to the running Chrome
+def attached_chrome_driver(debugger_address=CHROME_DEBUGGER_ADDRESS):
+    chrome_options = Options()
+    chrome_options.debugger_address = debugger_address  # Connect to running Chrome session
+    chrome_options.headless = False  # To see browser actions
+    return webdriver.Chrome(options=chrome_options)
+
+
+# Attach a new driver and open url in a fresh tab of its own. The tab is created and switched
+# to in one step, so drivers opening tabs from parallel workers never pick up each other's tab.
+def open_attached_tab(url, debugger_address=CHROME_DEBUGGER_ADDRESS):
+    driver = attached_chrome_driver(debugger_address)
+    driver.switch_to.new_window('tab')
+    driver.get(url)
+    return driver
+
+
+# A long-lived tab owned by its own attached driver
+class BrowserTab:
+    def __init__(self, driver, handle):
+        self.driver = driver
+        self.handle = handle
+
+    # Make this tab the driver's current window before using it
+    def activate(self):
+        if self.driver.current_window_handle != self.handle:
+            self.driver.switch_to.window(self.handle)
+        return self.driver
+
+    def is_alive(self):
+        try:
+            return self.handle in self.driver.window_handles
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.activate()
+            self.driver.close()
+        except Exception as e:
+            logger.debug(f"Error closing browser tab: {e}")
+
+
+# Pool of attached drivers, each with one reusable tab opened on start_url.
+# Tabs are created lazily up to `size` and handed out one caller at a time,
+# so up to `size` searches can run in parallel without paying driver setup
+# and the first page load on every call.
+class TabPool:
+    def __init__(self, start_url, size=2, debugger_address=CHROME_DEBUGGER_ADDRESS, ready=None):
+        self.start_url = start_url
+        self.size = max(1, size)
+        self.debugger_address = debugger_address
+        self.ready = ready
+        self._idle = queue.Queue()
+        self._tabs = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _open_tab(self):
+        # new_window switches to the tab it created, window_handles[-1] may be another thread's tab
+        driver = open_attached_tab(self.start_url, self.debugger_address)
+        handle = driver.current_window_handle
+        if self.ready:
+            # Block until the start page is usable instead of sleeping a fixed time
+            self.ready(driver)
+        logger.info(f"Opened pooled tab on {self.start_url}")
+        return BrowserTab(driver, handle)
+
+    def _acquire(self):
+        while True:
+            try:
+                tab = self._idle.get_nowait()
+            except queue.Empty:
+                tab = None
+            if tab is not None:
+                return tab
+
+            with self._lock:
+                can_open = len(self._tabs) < self.size
+                if can_open:
+                    # Reserve the slot before the slow tab setup
+                    self._tabs.append(None)
+            if not can_open:
+                # None is a wake-up sent when a broken tab freed its slot
+                tab = self._idle.get()
+                if tab is not None:
+                    return tab
+                continue
+
+            try:
+                tab = self._open_tab()
+            except Exception:
+                with self._lock:
+                    self._tabs.remove(None)
+                # Wake a caller waiting for a slot, it can now try to open the tab itself
+                self._idle.put(None)
+                raise
+            with self._lock:
+                self._tabs[self._tabs.index(None)] = tab
+            return tab
+
+    def _discard(self, tab):
+        with self._lock:
+            if tab in self._tabs:
+                self._tabs.remove(tab)
+        tab.close()
+        self._idle.put(None)
+
+    # Borrow a tab; yields its driver already switched to the tab
+    @contextmanager
+    def tab(self):
+        if self._closed:
+            raise RuntimeError("Tab pool is closed")
+
+        tab = self._acquire()
+        try:
+            yield tab.activate()
+        finally:
+            # A broken tab is replaced on the next acquire instead of being handed out again
+            if tab.is_alive():
+                self._idle.put(tab)
+            else:
+                self._discard(tab)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            tabs = [tab for tab in self._tabs if tab is not None]
+            self._tabs = []
+        for tab in tabs:
+            tab.close()
+
+
+_amazon_tab_pool = None
+_amazon_tab_pool_lock = threading.Lock()
+
+
+# Process-wide pool of Amazon tabs, sized by AMAZON_TAB_POOL_SIZE
+def get_amazon_tab_pool():
+    global _amazon_tab_pool
+    with _amazon_tab_pool_lock:
+        if _amazon_tab_pool is None:
+            _amazon_tab_pool = TabPool(
+                'https://www.amazon.com',
+                size=int(os.getenv('AMAZON_TAB_POOL_SIZE', 2)),
+                ready=lambda driver: wait_for_element(driver, 'amazon', '#twotabsearchtextbox'),
+            )
+            atexit.register(_amazon_tab_pool.close)
+    return _amazon_tab_pool
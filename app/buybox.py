@@ -0,0 +1,75 @@
+import numpy as np
+from datetime import datetime
+
+# Amazon's own seller id in Keepa's buyBoxSellerIdHistory
+AMAZON_SELLER_ID = 'ATVPDKIKX0DER'
+
+# Keepa minutes are counted from 2011-01-01, i.e. 21564000 minutes after the unix epoch
+KEEPA_EPOCH_MINUTES = 21564000
+MINUTES_PER_DAY = 1440
+
+
+# Convert a raw Keepa [minute, seller, minute, seller, ...] list into (utc day numbers, seller ids) arrays
+def keepa_history_to_arrays(buy_box_seller_history):
+    history = np.asarray(buy_box_seller_history, dtype=object)
+    minutes = history[::2].astype(np.int64)
+    sellers = history[1::2].astype(str)
+
+    # Days since the unix epoch (UTC), the same truncation pandas' dt.normalize() does
+    days = (minutes + KEEPA_EPOCH_MINUTES) // MINUTES_PER_DAY
+
+    # Keepa history is time ordered already, keep a stable sort as a safety net
+    if len(days) > 1 and np.any(np.diff(days) < 0):
+        order = np.argsort(days, kind='stable')
+        days, sellers = days[order], sellers[order]
+
+    return days, sellers
+
+
+# Count, for each history, the days in the last `last_n_days` (plus today) the buy box was held by `seller_id`.
+# Each day takes the last seller seen on or before that day (daily forward fill); days before the
+# first entry count as unknown. Empty histories return -1, like get_amazon_buy_box_count always did.
+def count_buy_box_days(histories, seller_id=AMAZON_SELLER_ID, last_n_days=90, today=None):
+    if today is None:
+        today = datetime.utcnow().date()
+    today_day = (today - datetime(1970, 1, 1).date()).days
+
+    counts = np.full(len(histories), -1, dtype=np.int64)
+
+    all_days = []
+    all_owner = []
+    all_is_seller = []
+    for i, history in enumerate(histories):
+        if not history:
+            continue
+        days, sellers = keepa_history_to_arrays(history)
+        all_days.append(days)
+        all_owner.append(np.full(len(days), i, dtype=np.int64))
+        all_is_seller.append(sellers == seller_id)
+
+    if not all_days:
+        return counts
+
+    days = np.concatenate(all_days)
+    owner = np.concatenate(all_owner)
+    is_seller = np.concatenate(all_is_seller)
+
+    # Pack (owner, day) into a single sortable key so one searchsorted covers the whole batch
+    span = max(int(days.max()), today_day) + 1
+    keys = owner * span + days
+    order = np.argsort(keys, kind='stable')
+    keys, owner, is_seller = keys[order], owner[order], is_seller[order]
+
+    present = np.unique(owner)
+    target_days = np.arange(today_day - last_n_days, today_day + 1, dtype=np.int64)
+    target_keys = present[:, None] * span + target_days[None, :]
+
+    # Last entry on or before each target day; it must belong to the same product
+    idx = np.searchsorted(keys, target_keys, side='right') - 1
+    valid = idx >= 0
+    safe_idx = np.where(valid, idx, 0)
+    valid &= owner[safe_idx] == present[:, None]
+    held = valid & is_seller[safe_idx]
+
+    counts[present] = held.sum(axis=1)
+    return counts
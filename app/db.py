@@ -1,19 +1,89 @@
+import logging
 import os
+import threading
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+# Nothing connects at import time: the engine is built on the first SessionLocal() / get_engine() call,
+# so importing main.py or a module that only needs the models stays cheap.
+#
+#   DATABASE_URL          required once a session is opened
+#   DB_POOL_SIZE          persistent connections kept per process (default 5)
+#   DB_MAX_OVERFLOW       extra connections opened under load and closed after (default 10)
+#   DB_POOL_TIMEOUT       seconds to wait for a free connection before failing (default 30)
+#   DB_POOL_RECYCLE       seconds after which a connection is replaced, keep it under the server's idle timeout (default 1800)
+#   DB_POOL_PRE_PING      check connections on checkout, drops the ones the server closed (default on)
+#   DB_PGBOUNCER          behind pgbouncer in transaction mode: no client-side pool, no prepared statements
+#   DB_CREATE_SCHEMA      run create_all in init_schema(), for throwaway databases; use alembic everywhere else
+
+_engine = None
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+
+def _env_flag(name, default):
+    return os.getenv(name, '1' if default else '0').lower() not in ('0', 'false', 'no', '')
+
+
+# create_engine keyword arguments for the URL and the DB_* settings
+def engine_options(url):
+    if _env_flag('DB_PGBOUNCER', False):
+        # pgbouncer owns the pool; a server connection may change between transactions,
+        # so nothing may be kept per connection (prepared statements, session state)
+        options = {'poolclass': NullPool}
+        if make_url(url).get_driver_name() == 'psycopg':
+            options['connect_args'] = {'prepare_threshold': None}
+        return options
+
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True),
+    }
+
+
+# The process-wide engine, created on first use
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            database_url = os.getenv("DATABASE_URL")
+            if not database_url:
+                raise ValueError("DATABASE_URL environment variable is not set")
+            options = engine_options(database_url)
+            _engine = create_engine(database_url, **options)
+            _session_factory.configure(bind=_engine)
+            logger.debug(f"Created database engine with {options}")
+    return _engine
+
 
-# Get the database URL from environment variables
-DATABASE_URL = os.getenv("DATABASE_URL")
+# Session factory, binds the engine on the first call
+def SessionLocal(**kwargs):
+    get_engine()
+    return _session_factory(**kwargs)
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is not set")
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# Close the pooled connections, e.g. at the end of a CLI job or in a forked worker
+def dispose_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
 
-# Create a session factory bound to the engine
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Import Base from models and create tables
-from .models import Base
-Base.metadata.create_all(bind=engine)
+# Opt-in schema bootstrap replacing the old import-time create_all: creates missing tables when
+# DB_CREATE_SCHEMA is set (or force=True). Migrations stay the way to change an existing schema.
+def init_schema(force=False):
+    if not (force or _env_flag('DB_CREATE_SCHEMA', False)):
+        return False
+    from .models import Base
+    Base.metadata.create_all(bind=get_engine())
+    return True
@@ -0,0 +1,168 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .extraction import absolute_url, parse
+from .prices import parse_price
+
+logger = logging.getLogger(__name__)
+
+# Plain desktop browser headers, retailers answer bare clients with bot pages
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+CURRENCY_SYMBOLS = {'USD': '$'}
+
+
+# JSON-LD prices come as numbers or as text like "5.99", "1,299.00" or "$5.99"
+def _json_ld_price(price, symbol):
+    if isinstance(price, (int, float)):
+        price = f"{price:.2f}"
+    price = str(price).strip()
+    amount = parse_price(price)[0]
+    if amount is None:
+        amount = parse_price(f"{symbol}{price}")[0]
+    return None if amount is None else f"{symbol}{amount:.2f}"
+
+
+def _iter_json_ld(root):
+    for script in root.xpath("//script[@type='application/ld+json']/text()"):
+        try:
+            data = json.loads(script)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            data = data.get('@graph', [data])
+        # A script holds one object, a list of them or an @graph
+        for item in data if isinstance(data, list) else []:
+            if isinstance(item, dict):
+                yield item
+
+
+# Title, price and images from the schema.org Product in the page's JSON-LD, None without one
+def json_ld_product_detail(root):
+    for item in _iter_json_ld(root):
+        types = item.get('@type')
+        if 'Product' not in (types if isinstance(types, list) else [types]):
+            continue
+
+        offers = item.get('offers') or {}
+        if isinstance(offers, list):
+            offers = offers[0] if offers else {}
+        price = offers.get('price') or offers.get('lowPrice')
+        symbol = CURRENCY_SYMBOLS.get(offers.get('priceCurrency', 'USD'), '$')
+        price = _json_ld_price(price, symbol) if price not in (None, '') else None
+        if not item.get('name') or price is None:
+            continue
+
+        images = item.get('image') or []
+        if isinstance(images, (str, dict)):
+            images = [images]
+        image_urls = [absolute_url(image if isinstance(image, str) else image.get('url', '')) for image in images]
+
+        return {
+            'title': " ".join(item['name'].split()),
+            'regular_price': "No regular price",
+            'price': price,
+            'image_urls': [url for url in image_urls if url],
+        }
+    return None
+
+
+# Product detail pages over pooled plain HTTP, with the browser as the fallback.
+# The page is parsed from its JSON-LD first, then from the server-rendered markup with the
+# retailer's extract function; only when both come up empty (or the request fails) is the
+# fallback called, and every fallback is logged and counted by reason.
+class DetailFetcher:
+    def __init__(self, name, extract, timeout=10, pool_size=8, headers=None):
+        self.name = name
+        self.extract = extract
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+
+        self._lock = threading.Lock()
+        self.http_hits = 0
+        self.http_seconds = 0.0
+        self.fallback_reasons = Counter()
+
+    def _is_complete(self, detail):
+        return detail and not detail['title'].startswith('No ') and not detail['price'].startswith('No ')
+
+    # Detail dict from plain HTTP, or (None, reason) when the page cannot be used
+    def _fetch_http(self, product_url):
+        try:
+            response = self.session.get(product_url, timeout=self.timeout)
+        except requests.RequestException as e:
+            return None, type(e).__name__
+        if response.status_code != 200:
+            return None, f"http_{response.status_code}"
+
+        # An empty body or odd markup must end in the browser fallback, not drop the product
+        try:
+            return self._extract(parse(response.content))
+        except Exception as e:
+            logger.debug(f"{self.name} detail page could not be parsed: {e}")
+            return None, 'parse_error'
+
+    def _extract(self, root):
+        detail = json_ld_product_detail(root)
+        if self._is_complete(detail):
+            # Prefer the markup images and prices: the JSON-LD often carries only the main image,
+            # and its offer price is often the list price rather than the sales price
+            markup = self.extract(root)
+            if len(markup['image_urls']) > len(detail['image_urls']):
+                detail['image_urls'] = markup['image_urls']
+            if markup['regular_price'] != "No regular price":
+                detail['regular_price'] = markup['regular_price']
+            if not markup['price'].startswith('No '):
+                detail['price'] = markup['price']
+            return detail, None
+
+        detail = self.extract(root)
+        if self._is_complete(detail):
+            return detail, None
+        return None, 'no_product_data'
+
+    # Title, prices and images of a product page. fallback() loads it in the browser and
+    # returns the same dict (or None), it is only called when plain HTTP did not work.
+    def fetch(self, product_url, fallback=None):
+        start = time.perf_counter()
+        detail, reason = self._fetch_http(product_url)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            if detail is not None:
+                self.http_hits += 1
+                self.http_seconds += elapsed
+            else:
+                self.fallback_reasons[reason] += 1
+        if detail is not None:
+            return detail
+
+        logger.info(f"{self.name} detail fetch fell back to the browser ({reason}): {product_url}")
+        return fallback() if fallback else None
+
+    def stats(self):
+        with self._lock:
+            fallbacks = sum(self.fallback_reasons.values())
+            return {
+                'http': self.http_hits,
+                'fallbacks': fallbacks,
+                'fallback_reasons': dict(self.fallback_reasons),
+                'http_ms_avg': self.http_seconds / self.http_hits * 1000 if self.http_hits else 0.0,
+            }
+
+    def close(self):
+        self.session.close()
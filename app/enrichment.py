@@ -0,0 +1,143 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from sqlalchemy import or_, select, update
+
+from .keepa_client import KEEPA_MAX_BATCH, chunked
+from .models import AmazonProduct
+from .opportunities import refresh_for_amazon_products
+
+logger = logging.getLogger(__name__)
+
+
+# Counters for an enrichment run, used to tune the worker count and batch size
+class EnrichmentStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.asins = 0
+        self.updated = 0
+        self.failed = 0
+        self.batches = 0
+        self.commits = 0
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def report(self):
+        elapsed = self.elapsed or 1e-9
+        return (
+            f"Enriched {self.asins} ASINs in {self.batches} batches ({self.updated} updated, {self.failed} failed) "
+            f"in {elapsed:.1f}s: {self.asins / elapsed:.2f} ASINs/sec, "
+            f"{self.commits} commits, {self.commits / elapsed:.2f} commits/sec"
+        )
+
+
+# Stream (id, asin) of unprocessed Amazon products in pages, keyset paginated on id.
+# Failed analyses are stored as -1 and still match the filter, the keyset keeps them from looping.
+def iter_candidate_pages(session, page_size=1000):
+    last_id = 0
+    while True:
+        page = session.execute(candidate_page_query(last_id, page_size)).all()
+        if not page:
+            return
+        last_id = page[-1].id
+        yield page
+
+
+# Next page of not yet analyzed Amazon products, served by ix_amazon_products_unanalyzed
+def candidate_page_query(last_id, page_size):
+    return (
+        select(AmazonProduct.id, AmazonProduct.asin)
+        .where(
+            AmazonProduct.id > last_id,
+            or_(AmazonProduct.amazon_buy_box_count.is_(None), AmazonProduct.amazon_buy_box_count == -1),
+        )
+        .order_by(AmazonProduct.id)
+        .limit(page_size)
+    )
+
+
+# Fetch and analyze one batch of (id, asin) rows, runs in a worker thread
+def _process_batch(fetch_batch, analyze_batch, rows):
+    data_by_asin = fetch_batch([row.asin for row in rows])
+    analyzed = analyze_batch({row.asin: data_by_asin.get(row.asin) for row in rows})
+    results = []
+    for row in rows:
+        amazon_buy_box_count, current_sellers = analyzed[row.asin]
+
+        # Convert numpy.int64 to native Python int
+        if isinstance(amazon_buy_box_count, np.integer):
+            amazon_buy_box_count = int(amazon_buy_box_count)
+        if isinstance(current_sellers, np.integer):
+            current_sellers = int(current_sellers)
+
+        results.append((row.id, row.asin, amazon_buy_box_count, current_sellers))
+    return results
+
+
+# Write one batch of results back with a single bulk UPDATE and commit
+def _write_results(session, results, stats):
+    values = []
+    for product_id, asin, amazon_buy_box_count, current_sellers in results:
+        if amazon_buy_box_count is None or current_sellers is None:
+            logger.error(f"Failed to update product {asin} due to missing data.")
+            stats.failed += 1
+            continue
+        if amazon_buy_box_count == -1:
+            stats.failed += 1
+        values.append({
+            'id': product_id,
+            'amazon_buy_box_count': amazon_buy_box_count,
+            'current_sellers': current_sellers,
+        })
+
+    stats.asins += len(results)
+    stats.batches += 1
+    if not values:
+        return
+
+    session.execute(update(AmazonProduct), values)
+    refresh_for_amazon_products(session, [value['id'] for value in values])
+    session.commit()
+    stats.commits += 1
+    stats.updated += len(values)
+    logger.debug(f"Updated {len(values)} Amazon products")
+
+
+# Enrich unprocessed Amazon products with buy box and seller analytics.
+# fetch_batch(asins) returns a dict of asin -> Keepa data and analyze_batch(data_by_asin) a dict of
+# asin -> (amazon_buy_box_count, current_sellers) for the whole batch; both run in a bounded thread
+# pool while this thread pages through the candidates and writes each batch back.
+def run_enrichment(session, fetch_batch, analyze_batch, workers=4, batch_size=KEEPA_MAX_BATCH, page_size=1000):
+    stats = EnrichmentStats()
+    max_pending = max(1, workers) * 2
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                try:
+                    _write_results(session, future.result(), stats)
+                except Exception as e:
+                    session.rollback()
+                    logger.error(f"Error processing enrichment batch: {e}")
+
+        for page in iter_candidate_pages(session, page_size):
+            for rows in chunked(page, batch_size):
+                pending.add(executor.submit(_process_batch, fetch_batch, analyze_batch, rows))
+                if len(pending) >= max_pending:
+                    drain(FIRST_COMPLETED)
+
+        while pending:
+            drain(FIRST_COMPLETED)
+
+    stats.finished = time.perf_counter()
+    logger.info(stats.report())
+    return stats
@@ -0,0 +1,164 @@
+from lxml import etree, html
+from selenium.webdriver.common.by import By
+
+# Retailer page extraction on lxml with precompiled XPath selectors.
+# Listing pages are parsed from the product container's outerHTML only, detail pages from the
+# full page source; both return the same values the BeautifulSoup code produced.
+
+_parser = html.HTMLParser(remove_comments=True)
+
+
+# XPath test for an element carrying every given class token
+def _has_classes(*classes):
+    return ' and '.join(f"contains(concat(' ', normalize-space(@class), ' '), ' {c} ')" for c in classes)
+
+
+# XPath test for an element whose class attribute is exactly these tokens in this order, like
+# BeautifulSoup's class_='a b': the atomic r-* classes also sit on nested elements of a tile
+def _class_is(*classes):
+    return f"normalize-space(@class)='{' '.join(classes)}'"
+
+
+def parse(markup):
+    return html.fromstring(markup, parser=_parser)
+
+
+def _text(elements, default):
+    return elements[0].text_content().strip() if elements else default
+
+
+# Like BeautifulSoup's " ".join(tag.stripped_strings)
+def _joined_strings(elements, default):
+    if not elements:
+        return default
+    return " ".join(s.strip() for s in elements[0].itertext() if s.strip())
+
+
+# Availability badge texts of a tile that is listed but not purchasable. Only the badge is read,
+# promotion text or "sold out online" on a variant elsewhere in the tile must not count.
+OUT_OF_STOCK_LABELS = {'out of stock', 'sold out', 'temporarily out of stock'}
+
+
+def _tile_in_stock(tile, availability_xpath):
+    badge = availability_xpath(tile)
+    return not badge or " ".join(badge[0].text_content().split()).lower() not in OUT_OF_STOCK_LABELS
+
+
+# Image URLs on these pages are often protocol relative
+def absolute_url(url):
+    return f"https:{url}" if url.startswith("//") else url
+
+
+_tile_href = etree.XPath("descendant::a[@href][1]/@href")
+
+
+def _listing_tile(tile, base_url, price_xpath, availability_xpath):
+    href = _tile_href(tile)
+    price = price_xpath(tile)
+    return {
+        'product_url': base_url + href[0] if href else None,
+        'price': " ".join(price[0].text_content().split()) if price else None,
+        'in_stock': _tile_in_stock(tile, availability_xpath),
+    }
+
+
+# Walgreens
+WALGREENS_LISTING_CONTAINER = 'ul.product-container'
+_walgreens_tiles = etree.XPath(f"descendant-or-self::li[{_class_is('item', 'owned-brands')}]")
+_walgreens_tile_price = etree.XPath(f"descendant::*[{_has_classes('product__price')}][1]")
+_walgreens_tile_availability = etree.XPath(f"descendant::*[{_has_classes('product__availability')}][1]")
+_walgreens_title = etree.XPath("//h1[@id='productName']")
+_walgreens_regular_price = etree.XPath("//div[@id='regular-price-wag-hn-lt-bold']")
+_walgreens_sales_price = etree.XPath("//span[@id='sales-price']")
+_walgreens_background_image = etree.XPath("(//div[contains(@style, 'background-image')])[1]/@style")
+_walgreens_thumbnails = etree.XPath("(//ul[@id='thumbnailImages'])[1]//li/descendant::img[1]/@src")
+
+
+# URL, price (None when the tile shows none) and stock of every listing tile
+def walgreens_listing_tiles(root):
+    return [
+        _listing_tile(tile, 'https://www.walgreens.com', _walgreens_tile_price, _walgreens_tile_availability)
+        for tile in _walgreens_tiles(root)
+    ]
+
+
+def walgreens_detail(root):
+    image_urls = []
+    style = _walgreens_background_image(root)
+    if style:
+        # Extract background image URL from style attribute
+        image_url = style[0].split('url(')[-1].split(')')[0].replace('"', '').replace("'", "")
+        image_urls.append(absolute_url(image_url))
+    # Thumbnail carousel as a fallback, its src is protocol relative
+    image_urls.extend(f"https:{src}" for src in _walgreens_thumbnails(root) if src)
+
+    return {
+        'title': _joined_strings(_walgreens_title(root), "No title found"),
+        'regular_price': _text(_walgreens_regular_price(root), "No regular price").replace('old price', '').strip(),
+        'price': _text(_walgreens_sales_price(root), "No sales price").replace('Sale price', '').strip(),
+        'image_urls': image_urls,
+    }
+
+
+# CVS
+CVS_LISTING_CONTAINER = (
+    "#root > div > div > div > div.css-1dbjc4n.r-13awgt0.r-1mlwlqe.r-1wgg2b2.r-13qz1uu > div > div:nth-child(1) > div > div > div > main > div > div > div.css-1dbjc4n.r-n2h5ot.r-bnwqim.r-13qz1uu > div > div > div > div.css-1dbjc4n.r-13awgt0.r-1mlwlqe > div > div > div"
+)
+_cvs_tiles = etree.XPath(f"descendant-or-self::div[{_class_is('css-1dbjc4n', 'r-18u37iz', 'r-tzz3ar')}]")
+_cvs_title = etree.XPath(
+    f"descendant::div[{_class_is('css-901oao', 'css-cens5h', 'r-b0vftf', 'r-1xaesmv', 'r-ubezar', 'r-majxgm', 'r-29m4ib', 'r-rjixqe', 'r-1bymd8e', 'r-fdjqy7', 'r-13qz1uu')}][1]"
+)
+_cvs_image = etree.XPath(f"descendant::img[{_has_classes('PLP-tile-image')}][1]/@src")
+_cvs_price = etree.XPath(f"descendant::div[{_has_classes('css-901oao')} and contains(@aria-label, 'Price')][1]")
+_cvs_href = etree.XPath("descendant::a[@href][1]/@href")
+
+
+def cvs_listing_products(root):
+    products = []
+    for tile in _cvs_tiles(root):
+        image = _cvs_image(tile)
+        href = _cvs_href(tile)
+        products.append({
+            'title': _text(_cvs_title(tile), "No title found"),
+            'price': _text(_cvs_price(tile), "No price found"),
+            'image_urls': [absolute_url(image[0]) if image else ''],
+            'product_url': 'https://www.cvs.com' + href[0] if href else "No URL found",
+            'source': 'cvs',
+        })
+    return products
+
+
+# Sam's Club
+SAMSCLUB_LISTING_CONTAINER = 'div.sc-plp-cards.sc-plp-cards-grid'
+_samsclub_tiles = etree.XPath(f"descendant-or-self::div[{_has_classes('sc-product-card')}]")
+_samsclub_tile_price = etree.XPath(f"descendant::*[{_has_classes('Price-group')} or {_has_classes('sc-price')}][1]")
+_samsclub_tile_availability = etree.XPath(f"descendant::*[{_has_classes('sc-pc-availability')}][1]")
+_samsclub_title = etree.XPath(f"//h1[{_has_classes('sc-product-title')}]")
+_samsclub_regular_price = etree.XPath(f"//span[{_has_classes('prod-price-old')}]")
+_samsclub_sales_price = etree.XPath(f"//span[{_has_classes('prod-price-primary')}]")
+_samsclub_image = etree.XPath(f"(//img[{_has_classes('sc-product-image')}])[1]/@src")
+
+
+def samsclub_listing_tiles(root):
+    return [
+        _listing_tile(tile, 'https://www.samsclub.com', _samsclub_tile_price, _samsclub_tile_availability)
+        for tile in _samsclub_tiles(root)
+    ]
+
+
+def samsclub_detail(root):
+    image = _samsclub_image(root)
+    return {
+        'title': _joined_strings(_samsclub_title(root), "No title found"),
+        'regular_price': _text(_samsclub_regular_price(root), "No regular price").replace('old price', '').strip(),
+        'price': _text(_samsclub_sales_price(root), "No sales price").replace('Sale price', '').strip(),
+        'image_urls': [absolute_url(image[0])] if image else [],
+    }
+
+
+# Parse the outerHTML of the element matching a CSS selector, or None when it is not on the page
+def listing_container(driver, css_selector):
+    elements = driver.find_elements(By.CSS_SELECTOR, css_selector)
+    if not elements:
+        return None
+    return parse(elements[0].get_attribute('outerHTML'))
@@ -0,0 +1,154 @@
+import logging
+import re
+from urllib.parse import unquote, urlparse, parse_qs
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import Product, AmazonProduct, ProductMatch
+from .opportunities import refresh_for_products
+from .prices import append_observations, observation, price_columns
+
+logger = logging.getLogger(__name__)
+
+
+def extract_asin(url):
+    # Try to extract ASIN directly from the path
+    match = re.search(r'/([A-Z0-9]{10})(?:[/?]|$)', url)
+    if match:
+        return match.group(1)
+
+    # If no match, check if ASIN is inside query parameters
+    parsed_url = urlparse(url)
+    query_params = parse_qs(parsed_url.query)
+    if 'url' in query_params:
+        decoded_url = unquote(query_params['url'][0])
+        match = re.search(r'/([A-Z0-9]{10})(?:[/?]|$)', decoded_url)
+        if match:
+            return match.group(1)
+
+    return None
+
+
+# Columns the products and amazon_products tables require, rows missing one are skipped
+# instead of failing the whole batch on a NOT NULL violation
+_PRODUCT_REQUIRED = ('title', 'product_url', 'source')
+_AMAZON_REQUIRED = ('url', 'title', 'image_url')
+
+
+def _missing(data, required):
+    return [key for key in required if not data.get(key)]
+
+
+# Upsert many (retail product, Amazon matches) pairs in a single transaction.
+# Each table gets one INSERT ... ON CONFLICT DO NOTHING; new retail products come back from
+# RETURNING and one SELECT resolves the ids of the existing ones. Existing rows are left untouched,
+# like insert_data_to_db always did, and only new products get a price observation, their first.
+# Rows that would break a NOT NULL column are skipped up front, and rows are inserted in key order
+# so concurrent page workers lock them in the same order. Returns a list of
+# (product_id, [amazon_product_id, ...]) in the order of the input pairs, None for a skipped product.
+def bulk_upsert_products(session, items):
+    items = list(items)
+    if not items:
+        return []
+
+    # Retail products, first occurrence of a URL wins
+    product_rows = {}
+    for product_data, _ in items:
+        missing = _missing(product_data, _PRODUCT_REQUIRED)
+        if missing:
+            logger.warning(f"Skipping product without {', '.join(missing)}: {product_data.get('product_url')}")
+            continue
+        product_rows.setdefault(product_data['product_url'], {
+            'title': product_data['title'],
+            'image_urls': product_data['image_urls'],
+            'product_url': product_data['product_url'],
+            'source': product_data['source'],
+            'last_seen_price': product_data['price'],
+            **price_columns(product_data['price']),
+            'in_stock': True,
+        })
+    if not product_rows:
+        return [None] * len(items)
+
+    # Amazon products keyed by the ASIN extracted from their URL, one row per URL as well
+    amazon_rows = {}
+    amazon_urls = set()
+    asins_per_item = []
+    for _, amazon_data in items:
+        asins = []
+        for amazon in amazon_data:
+            asin = extract_asin(amazon.get('url') or '')
+            missing = _missing(amazon, _AMAZON_REQUIRED)
+            if not asin or missing:
+                logger.warning(f"Skipping Amazon result without {', '.join(missing) or 'ASIN'}: {amazon.get('url')}")
+                continue
+            if asin not in amazon_rows and amazon['url'] not in amazon_urls:
+                amazon_rows[asin] = {
+                    'asin': asin,
+                    'title': amazon['title'],
+                    'product_url': amazon['url'],
+                    'image_url': amazon['image_url'],
+                }
+                amazon_urls.add(amazon['url'])
+            if asin in amazon_rows and asin not in asins:
+                asins.append(asin)
+        asins_per_item.append(asins)
+
+    inserted = dict(session.execute(
+        insert(Product)
+        .values([product_rows[url] for url in sorted(product_rows)])
+        .on_conflict_do_nothing(index_elements=['product_url'])
+        .returning(Product.product_url, Product.id)
+    ).all())
+    product_ids = dict(inserted)
+    existing_urls = [url for url in product_rows if url not in inserted]
+    if existing_urls:
+        product_ids.update(session.execute(
+            select(Product.product_url, Product.id).where(Product.product_url.in_(existing_urls))
+        ).all())
+
+    # New products start their price history. Rows skipped by ON CONFLICT keep their stored price,
+    # their sightings are recorded by the scrape run's KnownProductIndex
+    append_observations(session, [
+        observation(product_id, product_rows[url]['last_seen_price']) for url, product_id in inserted.items()
+    ])
+
+    amazon_product_ids = {}
+    if amazon_rows:
+        # No conflict target: an ASIN already stored under another URL, or a URL already stored
+        # under another ASIN, must not fail the batch. The first is resolved by ASIN, the second by URL.
+        session.execute(
+            insert(AmazonProduct).values([amazon_rows[asin] for asin in sorted(amazon_rows)]).on_conflict_do_nothing()
+        )
+        urls = {row['product_url']: asin for asin, row in amazon_rows.items()}
+        for asin, url, amazon_product_id in session.execute(
+            select(AmazonProduct.asin, AmazonProduct.product_url, AmazonProduct.id)
+            .where(or_(AmazonProduct.asin.in_(list(amazon_rows)), AmazonProduct.product_url.in_(list(urls))))
+        ):
+            if asin in amazon_rows:
+                amazon_product_ids[asin] = amazon_product_id
+            elif url in urls:
+                amazon_product_ids.setdefault(urls[url], amazon_product_id)
+
+    results = []
+    match_pairs = set()
+    for (product_data, _), asins in zip(items, asins_per_item):
+        product_id = product_ids.get(product_data.get('product_url'))
+        if product_id is None or product_data.get('product_url') not in product_rows:
+            results.append(None)
+            continue
+        ids = list(dict.fromkeys(amazon_product_ids[asin] for asin in asins if asin in amazon_product_ids))
+        match_pairs.update((product_id, amazon_product_id) for amazon_product_id in ids)
+        results.append((product_id, ids))
+
+    if match_pairs:
+        session.execute(
+            insert(ProductMatch)
+            .values([{'product_id': product_id, 'amazon_product_id': amazon_product_id} for product_id, amazon_product_id in sorted(match_pairs)])
+            .on_conflict_do_nothing(index_elements=['product_id', 'amazon_product_id'])
+        )
+        refresh_for_products(session, [product_id for product_id, _ in match_pairs])
+
+    session.commit()
+    return results
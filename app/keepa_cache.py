@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+
+from .keepa_client import KEEPA_MAX_BATCH, KEEPA_QUERY_PARAMS, fetch_products
+
+logger = logging.getLogger(__name__)
+
+# Cheap query used to read Keepa's lastUpdate marker without pulling history or offers
+MARKER_QUERY_PARAMS = {
+    'stats': None,
+    'offers': None,
+    'buybox': False,
+    'history': False,
+    'days': None,
+}
+
+
+# Local, zlib compressed cache of Keepa product payloads, one file per (asin, query params).
+# The file mtime is the time the payload was last confirmed fresh.
+class KeepaCache:
+    def __init__(self, cache_dir, ttl_seconds=24 * 3600):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.refreshed = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Content key of a product query: the ASIN plus every parameter that shapes the payload
+    @staticmethod
+    def key(asin, query_params):
+        raw = json.dumps({'asin': asin, 'params': query_params}, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl.z")
+
+    # Returns (entry, is_fresh) or (None, False) when nothing usable is stored
+    def load(self, key):
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                entry = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None, False
+        except Exception as e:
+            logger.warning(f"Discarding unreadable Keepa cache entry {path}: {e}")
+            return None, False
+        return entry, age <= self.ttl_seconds
+
+    def store(self, key, asin, product):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {'asin': asin, 'last_update': product.get('lastUpdate'), 'product': product}
+        data = zlib.compress(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+
+        # Write to a temp file and rename so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    # Mark a stale entry as fresh again without rewriting it
+    def touch(self, key):
+        os.utime(self._path(key))
+
+    def count(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+            'refreshed': self.refreshed,
+        }
+
+
+# Cached version of fetch_products. Fresh entries skip the network entirely; entries older than
+# the TTL are revalidated with a cheap marker query and only re-pulled when Keepa's lastUpdate moved.
+def fetch_products_cached(keepa_api, cache, asins, batch_size=KEEPA_MAX_BATCH, **query_params):
+    params = dict(KEEPA_QUERY_PARAMS, **query_params)
+    unique_asins = list(dict.fromkeys(asin for asin in asins if asin))
+    results = dict.fromkeys(unique_asins)
+    keys = {asin: cache.key(asin, params) for asin in unique_asins}
+
+    stale = {}
+    to_fetch = []
+    for asin in unique_asins:
+        entry, is_fresh = cache.load(keys[asin])
+        if entry and is_fresh:
+            results[asin] = entry['product']
+        elif entry:
+            stale[asin] = entry
+        else:
+            to_fetch.append(asin)
+    cache.count(hits=len(unique_asins) - len(stale) - len(to_fetch), misses=len(to_fetch))
+
+    if stale:
+        markers = fetch_products(keepa_api, list(stale), batch_size=batch_size, domain=params['domain'], **MARKER_QUERY_PARAMS)
+        revalidated = 0
+        for asin, entry in stale.items():
+            marker = markers.get(asin)
+            if marker is not None and entry['last_update'] is not None and marker.get('lastUpdate') == entry['last_update']:
+                cache.touch(keys[asin])
+                results[asin] = entry['product']
+                revalidated += 1
+            else:
+                to_fetch.append(asin)
+        cache.count(revalidated=revalidated, refreshed=len(stale) - revalidated)
+
+    if to_fetch:
+        fetched = fetch_products(keepa_api, to_fetch, batch_size=batch_size, **params)
+        for asin, product in fetched.items():
+            if product is not None:
+                cache.store(keys[asin], asin, product)
+                results[asin] = product
+            elif asin in stale:
+                # Keepa failed, an outdated payload beats no payload
+                results[asin] = stale[asin]['product']
+
+    logger.debug(f"Keepa cache: {cache.stats()}")
+    return results
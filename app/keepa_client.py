@@ -0,0 +1,85 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Keepa accepts at most 100 ASINs per product request
+KEEPA_MAX_BATCH = 100
+
+# Seconds to wait before the one retry of a request that failed for every ASIN alike
+KEEPA_RETRY_DELAY = 5
+
+# Query parameters used for the buy box / sellers analysis
+KEEPA_QUERY_PARAMS = {
+    'domain': 'US',  # Correct domain code for Amazon US
+    'stats': 90,  # Use 90 days of statistics
+    'offers': 20,  # Fetch up to 20 offers
+    'buybox': True,
+    'history': 1,
+    'days': 365,  # Fetch 365 days of history
+}
+
+
+# Split a list of ASINs into chunks of at most batch_size
+def chunked(items, batch_size):
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
+# Errors caused by the ASINs in the request: invalid codes, or Keepa rejecting the request (400)
+def _is_asin_error(error):
+    if isinstance(error, ValueError):
+        return True
+    return isinstance(error, RuntimeError) and ('invalid ASINs' in str(error) or str(error) == 'REQUEST_REJECTED')
+
+
+# Query one chunk of ASINs; when Keepa rejects the chunk because of its ASINs, split it in halves
+# so a single bad ASIN only costs itself instead of the whole batch. Any other failure (network
+# down, bad key, out of tokens) hits every ASIN alike: the chunk is retried once after
+# retry_delay and the error is raised, instead of splitting into ~2n failing requests.
+def _query_chunk(keepa_api, asins, results, query_params, retry_delay=KEEPA_RETRY_DELAY):
+    try:
+        product_data = keepa_api.query(asins, progress_bar=False, **query_params)
+    except Exception as e:
+        if not _is_asin_error(e):
+            if retry_delay is None:
+                raise
+            logger.warning(f"Keepa request for {len(asins)} ASINs failed ({e}), retrying once in {retry_delay}s")
+            time.sleep(retry_delay)
+            _query_chunk(keepa_api, asins, results, query_params, retry_delay=None)
+            return
+        if len(asins) == 1:
+            logger.error(f"Error fetching data from Keepa for ASIN {asins[0]}: {e}")
+            results[asins[0]] = None
+            return
+        logger.warning(f"Keepa batch of {len(asins)} ASINs failed ({e}), splitting it")
+        middle = len(asins) // 2
+        _query_chunk(keepa_api, asins[:middle], results, query_params, retry_delay)
+        _query_chunk(keepa_api, asins[middle:], results, query_params, retry_delay)
+        return
+
+    for product in product_data or []:
+        asin = product.get('asin') if product else None
+        if asin in results:
+            results[asin] = product
+
+
+# Fetch Keepa product data for many ASINs using the largest batches Keepa accepts.
+# Returns a dict of asin -> product data, None for ASINs Keepa rejected; raises when Keepa
+# itself is unavailable, so callers do not record every ASIN as failed.
+def fetch_products(keepa_api, asins, batch_size=KEEPA_MAX_BATCH, **query_params):
+    batch_size = max(1, min(batch_size, KEEPA_MAX_BATCH))
+    params = dict(KEEPA_QUERY_PARAMS, **query_params)
+
+    # Deduplicate while keeping the caller's order
+    unique_asins = list(dict.fromkeys(asin for asin in asins if asin))
+    results = dict.fromkeys(unique_asins)
+
+    for chunk in chunked(unique_asins, batch_size):
+        logger.debug(f"Fetching data from Keepa for {len(chunk)} ASINs")
+        _query_chunk(keepa_api, chunk, results, params)
+
+    missing = sum(1 for product in results.values() if product is None)
+    if missing:
+        logger.warning(f"No Keepa data for {missing} of {len(results)} ASINs")
+    return results
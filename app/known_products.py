@@ -0,0 +1,118 @@
+import logging
+import threading
+
+from sqlalchemy import func, select, update
+
+from .models import Product
+from .opportunities import refresh_for_products
+from .prices import append_observations, observation, price_columns
+
+logger = logging.getLogger(__name__)
+
+
+# Everything a scrape run needs about the products of a source, an index-only scan of ix_products_source
+def known_products_query(source):
+    return select(Product.product_url, Product.id, Product.last_seen_price, Product.in_stock).where(Product.source == source)
+
+
+# What a scrape run needs to know about a product already in the database
+class KnownProduct:
+    __slots__ = ('id', 'last_seen_price', 'in_stock')
+
+    def __init__(self, id, last_seen_price, in_stock):
+        self.id = id
+        self.last_seen_price = last_seen_price
+        self.in_stock = in_stock
+
+
+# In-memory index of the known products of one source, loaded once per scrape run and shared by
+# the parallel page workers and their pipelines. Lookups are served from memory and price/stock
+# changes are collected and flushed together with a single bulk UPDATE instead of a session per product.
+class KnownProductIndex:
+    def __init__(self, session_factory, source, flush_every=200):
+        self.session_factory = session_factory
+        self.source = source
+        self.flush_every = flush_every
+        self.products = {}
+        self.pending = {}
+        self.touched = set()
+        self.observations = []
+        # add / mark_seen / flush come from several page and persist threads; mark_seen flushes itself
+        self._lock = threading.RLock()
+
+    def load(self):
+        session = self.session_factory()
+        try:
+            rows = session.execute(known_products_query(self.source)).all()
+        finally:
+            session.close()
+
+        self.products = {row.product_url: KnownProduct(row.id, row.last_seen_price, row.in_stock) for row in rows}
+        logger.info(f"Loaded {len(self.products)} known {self.source} products")
+        return self
+
+    def get(self, product_url):
+        return self.products.get(product_url)
+
+    # Register a product inserted during this run so later listings see it
+    def add(self, product_url, product_id, price, in_stock=True):
+        with self._lock:
+            self.products[product_url] = KnownProduct(product_id, price, in_stock)
+
+    # Record that a known product was seen at `price`, queueing an update if anything changed.
+    # Unchanged products are only touched, so updated_date still tells when they were last seen.
+    # Every sighting is also appended to the price history.
+    def mark_seen(self, product_url, price, in_stock=True):
+        with self._lock:
+            known = self.products[product_url]
+            self.observations.append(observation(known.id, price, in_stock))
+            if known.last_seen_price == price and known.in_stock == in_stock:
+                if known.id not in self.pending:
+                    self.touched.add(known.id)
+                changed = False
+            else:
+                known.last_seen_price = price
+                known.in_stock = in_stock
+                self.touched.discard(known.id)
+                self.pending[known.id] = dict(price_columns(price), id=known.id, last_seen_price=price, in_stock=in_stock)
+                changed = True
+
+            if len(self.observations) >= self.flush_every:
+                self.flush()
+            return changed
+
+    # Write all queued changes with one bulk UPDATE, the touches with one more and the
+    # price observations with one INSERT, all in one transaction
+    def flush(self):
+        with self._lock:
+            if not self.pending and not self.touched and not self.observations:
+                return 0
+
+            changes = list(self.pending.values())
+            touched = list(self.touched)
+            observations = list(self.observations)
+            session = self.session_factory()
+            try:
+                append_observations(session, observations)
+                if changes:
+                    session.execute(update(Product), changes)
+                    # Stock and price feed the flip opportunities, touches change neither
+                    refresh_for_products(session, [change['id'] for change in changes])
+                if touched:
+                    session.execute(
+                        update(Product).where(Product.id.in_(touched)).values(updated_date=func.now()),
+                        execution_options={'synchronize_session': False},
+                    )
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error flushing {len(changes) + len(touched)} {self.source} product updates: {e}")
+                return 0
+            finally:
+                session.close()
+
+            self.pending.clear()
+            self.touched.clear()
+            self.observations.clear()
+            logger.debug(f"Flushed {len(changes)} {self.source} product updates and {len(touched)} touches")
+            return len(changes) + len(touched)
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+
+import numpy as np
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Bump the version when the prompt or model changes so cached verdicts are not reused
+MATCH_MODEL = "gpt-4o-mini"
+MATCH_PROMPT = "In the first image i have a product, check if the produt is present in any othe other images make sure is the same product with teh same colors and details. return just an array and nothing else with the list of integer indexes of images that match the first image."
+MATCH_PROMPT_VERSION = f"{MATCH_MODEL}:1"
+
+
+# Chat message with the retailer image first and the Amazon images after it
+def build_match_messages(first_image_url, amazon_image_urls):
+    content = [
+        {"type": "text", "text": MATCH_PROMPT},
+        {"type": "image_url", "image_url": {"url": first_image_url}},
+    ]
+    for image_url in amazon_image_urls:
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    return [{"role": "user", "content": content}]
+
+
+# Parse the model answer into a list of 1-based indexes, None when it is not a JSON list
+def parse_matching_indexes(message_content):
+    message_content = message_content.strip()
+
+    # Remove any backticks or unnecessary formatting around the JSON
+    if message_content.startswith("```") and message_content.endswith("```"):
+        message_content = message_content[3:-3].strip()
+
+    # If there's a "json" label, remove it
+    if message_content.startswith("json"):
+        message_content = message_content[4:].strip()
+
+    try:
+        matching_indexes = json.loads(message_content)
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse JSON: {e}")
+        return None
+
+    if not isinstance(matching_indexes, list):
+        logger.warning(f"Unexpected response, expected a list of indexes: {message_content}")
+        return None
+    return matching_indexes
+
+
+def _is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+# Asyncio image matching service on the async OpenAI client.
+# It runs its own event loop in a background thread, so synchronous scrapers can
+# submit() jobs and keep going while at most `concurrency` requests are in flight.
+# 429 and 5xx answers are retried with full-jitter exponential backoff.
+class MatchingService:
+    def __init__(self, concurrency=4, max_retries=5, base_delay=1.0, max_delay=30.0, base_url=None, api_key=None, timeout=60.0):
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._client_kwargs = {'base_url': base_url, 'api_key': api_key, 'timeout': timeout, 'max_retries': 0}
+        self._latencies = []
+        self._counters = {'requests': 0, 'errors': 0, 'retries': 0}
+        self._stats_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._client = openai.AsyncOpenAI(**{k: v for k, v in self._client_kwargs.items() if v is not None})
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                ready.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name='matching-service', daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+
+    async def _create_with_retry(self, messages):
+        attempt = 0
+        while True:
+            try:
+                return await self._client.chat.completions.create(model=MATCH_MODEL, messages=messages, max_tokens=300)
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                with self._stats_lock:
+                    self._counters['retries'] += 1
+                logger.debug(f"OpenAI request failed ({e}), retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    # Coroutine returning the 1-based matching indexes (None when the answer cannot be parsed)
+    async def match(self, first_image_url, amazon_image_urls):
+        messages = build_match_messages(first_image_url, amazon_image_urls)
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                response = await self._create_with_retry(messages)
+            except Exception:
+                with self._stats_lock:
+                    self._counters['errors'] += 1
+                raise
+            finally:
+                with self._stats_lock:
+                    self._counters['requests'] += 1
+                    self._latencies.append(time.perf_counter() - start)
+        return parse_matching_indexes(response.choices[0].message.content)
+
+    # Enqueue a match job from any thread, returns a concurrent.futures.Future
+    def submit(self, first_image_url, amazon_image_urls):
+        self._start()
+        return asyncio.run_coroutine_threadsafe(self.match(first_image_url, amazon_image_urls), self._loop)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = np.array(self._latencies)
+            stats = dict(self._counters)
+        if len(latencies):
+            stats.update({
+                'p50': float(np.percentile(latencies, 50)),
+                'p95': float(np.percentile(latencies, 95)),
+                'max': float(latencies.max()),
+            })
+        return stats
+
+    def close(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
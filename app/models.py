@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, ARRAY, Index, DateTime, Boolean, func
+from sqlalchemy import Column, Integer, BigInteger, Numeric, String, ForeignKey, ARRAY, Index, DateTime, Boolean, func, or_
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -13,6 +13,9 @@ class Product(Base):
     product_url = Column(String, unique=True, nullable=False, index=True)  # Index on product_url
     source = Column(String, nullable=False)  # Source, e.g., 'walgreens'
     last_seen_price = Column(String, nullable=True)  # Last seen price of the product
+    price = Column(Numeric(10, 2), nullable=True)  # last_seen_price parsed, NULL when it holds no price
+    currency = Column(String(3), nullable=True)  # ISO code of price, e.g. 'USD'
+    promo_text = Column(String, nullable=True)  # Promotion text next to the price, e.g. 'Buy 1, Get 1 Free'
     in_stock = Column(Boolean, nullable=False, default=False)  # Whether the product is in stock
 
     # Timestamps
@@ -22,6 +25,13 @@ class Product(Base):
     # Relationship with ProductMatch
     product_matches = relationship('ProductMatch', back_populates='product')
 
+    # Newest in-stock products first for the reports, and the per-source load of a scrape run
+    # answered from the index alone
+    __table_args__ = (
+        Index('ix_products_in_stock_id', id.desc(), postgresql_where=in_stock),
+        Index('ix_products_source', 'source', postgresql_include=['id', 'product_url', 'last_seen_price', 'in_stock']),
+    )
+
 
 # AmazonProduct model
 class AmazonProduct(Base):
@@ -39,6 +49,16 @@ class AmazonProduct(Base):
     created_date = Column(DateTime, default=func.now(), nullable=False)
     updated_date = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
 
+    # Products Keepa still has to analyze (NULL, or -1 when it had no history), paged by id;
+    # and the buy box / sellers thresholds of the opportunity queries
+    __table_args__ = (
+        Index(
+            'ix_amazon_products_unanalyzed', 'id', postgresql_include=['asin'],
+            postgresql_where=or_(amazon_buy_box_count.is_(None), amazon_buy_box_count == -1),
+        ),
+        Index('ix_amazon_products_buy_box_sellers', 'amazon_buy_box_count', 'current_sellers'),
+    )
+
 
 # ProductMatch model (many-to-many relation between Product and AmazonProduct)
 class ProductMatch(Base):
@@ -51,6 +71,7 @@ class ProductMatch(Base):
     # Composite index on product_id and amazon_product_id for faster lookups
     __table_args__ = (
         Index('ix_product_amazon_match', 'product_id', 'amazon_product_id', unique=True),
+        Index('ix_product_matches_amazon_product_id', 'amazon_product_id', 'product_id'),  # Amazon side of the join
     )
 
     # Timestamps
@@ -60,3 +81,47 @@ class ProductMatch(Base):
     # Relationships
     product = relationship('Product', back_populates='product_matches')
     amazon_product = relationship('AmazonProduct')
+
+
+# PriceObservation model (append-only price and stock history of the retail products)
+class PriceObservation(Base):
+    __tablename__ = 'price_observations'
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="CASCADE"), nullable=False)
+    observed_at = Column(DateTime, default=func.now(), nullable=False)
+    price = Column(Numeric(10, 2), nullable=True)
+    currency = Column(String(3), nullable=True)
+    promo_text = Column(String, nullable=True)
+    in_stock = Column(Boolean, nullable=False)
+
+    # Rows arrive in observed_at order, a BRIN index covers time ranges at a fraction of a btree's size;
+    # the btree serves per-product history lookups
+    __table_args__ = (
+        Index('ix_price_observations_observed_at', 'observed_at', postgresql_using='brin'),
+        Index('ix_price_observations_product_observed_at', 'product_id', 'observed_at'),
+    )
+
+
+# FlipOpportunity model (precomputed in-stock products whose Amazon match passes the flip thresholds,
+# kept up to date by app/opportunities.py whenever the rows it is built from change)
+class FlipOpportunity(Base):
+    __tablename__ = 'flip_opportunities'
+
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="CASCADE"), primary_key=True)
+    amazon_product_id = Column(Integer, ForeignKey('amazon_products.id', ondelete="CASCADE"), primary_key=True)
+    source = Column(String, nullable=False)
+    product_url = Column(String, nullable=False)
+    title = Column(String, nullable=False)
+    price = Column(Numeric(10, 2), nullable=True)
+    asin = Column(String, nullable=False)
+    amazon_url = Column(String, nullable=False)
+    amazon_buy_box_count = Column(Integer, nullable=False)
+    current_sellers = Column(Integer, nullable=False)
+    updated_date = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+    # Top-N: fewest Amazon buy box days first, newest products first among equals
+    __table_args__ = (
+        Index('ix_flip_opportunities_rank', 'amazon_buy_box_count', product_id.desc()),
+        Index('ix_flip_opportunities_amazon_product_id', 'amazon_product_id'),
+    )
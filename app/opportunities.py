@@ -0,0 +1,86 @@
+import logging
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .models import AmazonProduct, FlipOpportunity, Product, ProductMatch
+
+logger = logging.getLogger(__name__)
+
+# What makes a match a flip opportunity, also the loosest thresholds the report can serve
+# from the flip_opportunities table
+MAX_BUY_BOX_COUNT = 45  # Amazon held the buy box on fewer days than this in the last 90
+MIN_SELLERS = 2  # more sellers than this on the listing
+
+
+def _opportunity_rows():
+    return (
+        select(
+            Product.id, AmazonProduct.id, Product.source, Product.product_url, Product.title, Product.price,
+            AmazonProduct.asin, AmazonProduct.product_url, AmazonProduct.amazon_buy_box_count, AmazonProduct.current_sellers,
+        )
+        .join(ProductMatch, ProductMatch.product_id == Product.id)
+        .join(AmazonProduct, AmazonProduct.id == ProductMatch.amazon_product_id)
+        .where(
+            Product.in_stock == True,
+            AmazonProduct.amazon_buy_box_count < MAX_BUY_BOX_COUNT,
+            AmazonProduct.current_sellers > MIN_SELLERS,
+        )
+    )
+
+
+_COLUMNS = [
+    'product_id', 'amazon_product_id', 'source', 'product_url', 'title', 'price',
+    'asin', 'amazon_url', 'amazon_buy_box_count', 'current_sellers',
+]
+
+
+# Recompute the opportunities of the rows matching `condition` on the join and on the table:
+# one DELETE and one INSERT ... SELECT, inside the caller's transaction. A refresh by product and
+# one by Amazon product may cover the same pair at the same time, so the INSERT upserts: the
+# second writer overwrites the row the first one committed instead of failing on the primary key.
+def _refresh(session, table_condition, join_condition):
+    session.execute(delete(FlipOpportunity).where(table_condition), execution_options={'synchronize_session': False})
+    statement = pg_insert(FlipOpportunity).from_select(_COLUMNS, _opportunity_rows().where(join_condition))
+    statement = statement.on_conflict_do_update(
+        index_elements=['product_id', 'amazon_product_id'],
+        set_=dict({column: statement.excluded[column] for column in _COLUMNS[2:]}, updated_date=func.now()),
+    )
+    return session.execute(statement).rowcount
+
+
+# After retail products changed (stock, price, new matches)
+def refresh_for_products(session, product_ids):
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return 0
+    return _refresh(session, FlipOpportunity.product_id.in_(product_ids), Product.id.in_(product_ids))
+
+
+# After Amazon analytics (buy box count, sellers) changed
+def refresh_for_amazon_products(session, amazon_product_ids):
+    amazon_product_ids = list(set(amazon_product_ids))
+    if not amazon_product_ids:
+        return 0
+    return _refresh(
+        session,
+        FlipOpportunity.amazon_product_id.in_(amazon_product_ids),
+        AmazonProduct.id.in_(amazon_product_ids),
+    )
+
+
+# Rebuild the whole table, for the initial fill or after changing the thresholds
+def rebuild(session):
+    session.execute(delete(FlipOpportunity), execution_options={'synchronize_session': False})
+    count = session.execute(insert(FlipOpportunity).from_select(_COLUMNS, _opportunity_rows())).rowcount
+    session.commit()
+    logger.info(f"Rebuilt flip_opportunities with {count} rows")
+    return count
+
+
+# Best opportunities first (fewest Amazon buy box days, then newest), read from ix_flip_opportunities_rank
+def top_opportunities(session, limit=100, source=None):
+    query = select(FlipOpportunity).order_by(FlipOpportunity.amazon_buy_box_count, FlipOpportunity.product_id.desc()).limit(limit)
+    if source is not None:
+        query = query.where(FlipOpportunity.source == source)
+    return session.execute(query).scalars().all()
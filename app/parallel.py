@@ -0,0 +1,53 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+# Product URLs already taken by a worker in this run, shared across the page workers
+class ProductUrlClaims:
+    def __init__(self):
+        self._urls = set()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    # True the first time a URL is claimed, False for every later claim
+    def claim(self, product_url):
+        with self._lock:
+            if product_url in self._urls:
+                self.duplicates += 1
+                return False
+            self._urls.add(product_url)
+            return True
+
+
+# Scrape listing pages in parallel. Every page runs scrape_page(target_url, claims=claims) in its
+# own worker, and so in its own browser tab and driver session; claims keeps a product that shows
+# up on several pages from being processed twice. Returns the merged products in page order.
+def scrape_pages(scrape_page, target_urls, workers=1):
+    claims = ProductUrlClaims()
+    start = time.perf_counter()
+
+    def run(target_url):
+        try:
+            return scrape_page(target_url, claims=claims) or []
+        except Exception as e:
+            logger.error(f"Error scraping {target_url}: {e}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='page') as executor:
+        pages = list(executor.map(run, target_urls))
+
+    merged = {}
+    for products in pages:
+        for product in products:
+            merged.setdefault(product['product_url'], product)
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Scraped {len(target_urls)} pages with {workers} workers in {elapsed:.1f}s: "
+        f"{len(merged)} new products, {claims.duplicates} cross-page duplicates skipped"
+    )
+    return list(merged.values())
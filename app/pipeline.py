@@ -0,0 +1,176 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+# Raised by a batch func when only some of its items failed: the results are still passed on
+# and the failed items are counted as errors instead of the whole batch.
+class PartialBatchFailure(Exception):
+    def __init__(self, failed, results=None):
+        super().__init__(f"{failed} item(s) failed")
+        self.failed = failed
+        self.results = results or []
+
+
+# One step of a pipeline: `workers` threads take items from the stage's bounded input queue
+# and pass func's result to the next stage. Returning None drops the item. With batch_size > 1
+# func receives a list of up to batch_size items (waiting at most batch_timeout for more) and
+# returns a list of results.
+class Stage:
+    def __init__(self, name, func, workers=1, queue_size=100, batch_size=1, batch_timeout=0.5):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = max(1, batch_size)
+        self.batch_timeout = batch_timeout
+        self.next = None
+
+        self._lock = threading.Lock()
+        self._running = self.workers
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+
+    def _sample_depth(self):
+        depth = self.queue.qsize()
+        with self._lock:
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.depth_max = max(self.depth_max, depth)
+
+    # Next batch of items; an empty list with stopped=True once the stop marker was seen
+    def _take(self):
+        item = self.queue.get()
+        self._sample_depth()
+        if item is _STOP:
+            return [], True
+
+        items = [item]
+        deadline = time.perf_counter() + self.batch_timeout
+        while len(items) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _emit(self, result):
+        if result is not None and self.next is not None:
+            self.next.queue.put(result)
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            items, stopped = self._take()
+            if not items:
+                continue
+
+            start = time.perf_counter()
+            try:
+                if self.batch_size > 1:
+                    for result in self.func(items) or []:
+                        self._emit(result)
+                else:
+                    self._emit(self.func(items[0]))
+                failed = 0
+            except PartialBatchFailure as e:
+                for result in e.results:
+                    self._emit(result)
+                failed = e.failed
+                logger.error(f"Pipeline stage {self.name} failed on {failed} of {len(items)} item(s)")
+            except Exception as e:
+                failed = len(items)
+                logger.error(f"Pipeline stage {self.name} failed on {len(items)} item(s): {e}")
+
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - start
+                self.processed += len(items) - failed
+                self.errors += failed
+
+        # The last worker out tells the next stage to stop once this one is drained
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            if self.next is not None:
+                self.next.queue.put(_STOP)
+        else:
+            # Pass the stop marker on to a sibling still blocked on the queue
+            self.queue.put(_STOP)
+
+    def metrics(self, elapsed):
+        with self._lock:
+            return {
+                'processed': self.processed,
+                'errors': self.errors,
+                'per_sec': self.processed / elapsed if elapsed else 0.0,
+                'busy_per_item': self.busy_seconds / self.processed if self.processed else 0.0,
+                'queue_avg': self.depth_total / self.depth_samples if self.depth_samples else 0.0,
+                'queue_max': self.depth_max,
+            }
+
+
+# Stages connected by bounded queues, each with its own worker count, so a slow stage
+# only backs up its own queue instead of stalling the producers.
+class Pipeline:
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next = next_stage
+        self._threads = []
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        for stage in self.stages:
+            for i in range(stage.workers):
+                thread = threading.Thread(target=stage._run, name=f"{self.name}-{stage.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    # Feed an item to the first stage, blocks while its queue is full
+    def put(self, item):
+        self.stages[0].queue.put(item)
+
+    # Stop accepting items, wait until every stage is drained and log the metrics
+    def close(self):
+        self.stages[0].queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        logger.info(self.report())
+
+    def metrics(self):
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {stage.name: stage.metrics(elapsed) for stage in self.stages}
+
+    def report(self):
+        lines = [f"Pipeline {self.name}:"]
+        for name, m in self.metrics().items():
+            lines.append(
+                f"  {name}: {m['processed']} done, {m['errors']} errors, {m['per_sec']:.2f}/sec, "
+                f"{m['busy_per_item']:.2f}s/item, queue avg {m['queue_avg']:.1f} max {m['queue_max']}"
+            )
+        return "\n".join(lines)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
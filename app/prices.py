@@ -0,0 +1,70 @@
+import re
+from decimal import Decimal
+
+from sqlalchemy import insert, select
+
+from .models import PriceObservation, Product
+
+CURRENCY_SYMBOLS = {'$': 'USD', '€': 'EUR', '£': 'GBP'}
+
+_PRICE_RE = re.compile(r'([$€£])\s*(\d+(?:,\d{3})*(?:\.\d{1,2})?)')
+# Labels the retailers put around the price, not promotion text
+_PRICE_LABELS_RE = re.compile(r'\b(?:sale price|old price|price|each|ea)\b|[:/]', re.IGNORECASE)
+
+
+# Split a scraped price text ("$12.99", "Sale price $9.99", "2 for $5.00 Buy 1, Get 1 Free",
+# "No sales price") into (amount, currency, promo_text). Amount and currency are None when
+# the text holds no price, promo_text is None when the text is only the price and its labels.
+def parse_price(text):
+    if not text:
+        return None, None, None
+
+    match = _PRICE_RE.search(text)
+    if not match:
+        return None, None, None if text.startswith('No ') else text.strip() or None
+
+    amount = Decimal(match.group(2).replace(',', ''))
+    # Keep the price inside promotions like "2 for $5.00", drop the text when it is only the price
+    rest = _PRICE_LABELS_RE.sub(' ', text[:match.start()] + ' ' + text[match.end():])
+    promo_text = " ".join(_PRICE_LABELS_RE.sub(' ', text).split()) if rest.strip() else None
+    return amount, CURRENCY_SYMBOLS[match.group(1)], promo_text
+
+
+# price / currency / promo_text column values for a scraped price text
+def price_columns(text):
+    amount, currency, promo_text = parse_price(text)
+    return {'price': amount, 'currency': currency, 'promo_text': promo_text}
+
+
+# Row for the price_observations table
+def observation(product_id, price_text, in_stock=True):
+    return dict(price_columns(price_text), product_id=product_id, in_stock=in_stock)
+
+
+# Append observations with one multi-row INSERT, inside the caller's transaction
+def append_observations(session, observations):
+    if observations:
+        session.execute(insert(PriceObservation), observations)
+    return len(observations)
+
+
+# Products of a source whose current price is at least min_drop below their last observed price
+# at or before `since`. DISTINCT ON walks ix_price_observations_product_observed_at backwards,
+# one index range per product. Returns (product, old price) pairs, biggest drop first.
+def price_drops_since(session, since, source=None, min_drop=Decimal('0.01')):
+    previous = (
+        select(PriceObservation.product_id, PriceObservation.price)
+        .where(PriceObservation.observed_at <= since, PriceObservation.price.is_not(None))
+        .order_by(PriceObservation.product_id, PriceObservation.observed_at.desc())
+        .distinct(PriceObservation.product_id)
+        .subquery()
+    )
+    query = (
+        select(Product, previous.c.price)
+        .join(previous, previous.c.product_id == Product.id)
+        .where(Product.price <= previous.c.price - min_drop)
+        .order_by((previous.c.price - Product.price).desc())
+    )
+    if source is not None:
+        query = query.where(Product.source == source)
+    return session.execute(query).all()
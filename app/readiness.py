@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+# Upper bound, in seconds, for any readiness wait on each site
+SITE_TIMEOUTS = {
+    'amazon': 30,
+    'walgreens': 15,
+    'cvs': 30,
+    'samsclub': 15,
+}
+DEFAULT_TIMEOUT = 30
+POLL_FREQUENCY = 0.1
+
+
+# Counts finished resource requests with a PerformanceObserver installed once per document.
+# performance.getEntriesByType('resource') stops growing at the browser's 250 entry buffer,
+# which busy pages like Amazon results exceed; the observer sees every entry.
+_RESOURCE_COUNT_SCRIPT = """
+if (!window.__readinessResources) {
+    window.__readinessResources = {count: performance.getEntriesByType('resource').length};
+    new PerformanceObserver(function (list) {
+        window.__readinessResources.count += list.getEntries().length;
+    }).observe({type: 'resource'});
+}
+return [document.readyState, window.__readinessResources.count];
+"""
+
+
+# Page has finished loading and no new network resources arrived for idle_seconds
+class network_idle:
+    def __init__(self, idle_seconds=0.5):
+        self.idle_seconds = idle_seconds
+        self.last_count = None
+        self.last_change = None
+
+    def __call__(self, driver):
+        state, count = driver.execute_script(_RESOURCE_COUNT_SCRIPT)
+        now = time.perf_counter()
+        if state != 'complete' or count != self.last_count:
+            self.last_count = count
+            self.last_change = now
+            return False
+        return now - self.last_change >= self.idle_seconds
+
+
+# At least `count` elements match the locator; returns them
+class elements_populated:
+    def __init__(self, locator, count=1):
+        self.locator = locator
+        self.count = count
+
+    def __call__(self, driver):
+        elements = driver.find_elements(*self.locator)
+        return elements if len(elements) >= self.count else False
+
+
+# How long each (site, condition) wait actually took
+class WaitStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = {}
+
+    def record(self, site, name, seconds, timed_out):
+        with self._lock:
+            entry = self.waits.setdefault((site, name), {'count': 0, 'total': 0.0, 'max': 0.0, 'timeouts': 0})
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['timeouts'] += int(timed_out)
+
+    def report(self):
+        with self._lock:
+            lines = []
+            for (site, name), entry in sorted(self.waits.items()):
+                lines.append(
+                    f"{site}/{name}: {entry['count']} waits, avg {entry['total'] / entry['count']:.2f}s, "
+                    f"max {entry['max']:.2f}s, {entry['timeouts']} timeouts"
+                )
+            return "\n".join(lines)
+
+
+wait_stats = WaitStats()
+
+
+# Wait until condition(driver) is truthy, bounded by the site timeout, and record how long it took.
+# Raises TimeoutException like WebDriverWait.until does.
+def wait_until(driver, site, name, condition, timeout=None):
+    timeout = timeout or SITE_TIMEOUTS.get(site, DEFAULT_TIMEOUT)
+    start = time.perf_counter()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY).until(condition)
+    except TimeoutException:
+        wait_stats.record(site, name, time.perf_counter() - start, True)
+        raise
+    elapsed = time.perf_counter() - start
+    wait_stats.record(site, name, elapsed, False)
+    logger.debug(f"{site}/{name} ready after {elapsed:.2f}s")
+    return result
+
+
+# Shortcut for the common "element is in the DOM" wait
+def wait_for_element(driver, site, css_selector, timeout=None):
+    return wait_until(driver, site, css_selector, EC.presence_of_element_located((By.CSS_SELECTOR, css_selector)), timeout)
+
+
+# The URL moved away from old_url or old_element was detached: a new page replaced the old one
+class navigated:
+    def __init__(self, old_element, old_url=None):
+        self.old_element = old_element
+        self.old_url = old_url
+
+    def __call__(self, driver):
+        if self.old_url is not None and driver.current_url != self.old_url:
+            return True
+        return self.old_element is not None and EC.staleness_of(self.old_element)(driver)
+
+
+# Wait for an element from the previous page to be detached (or the URL to change), i.e. the
+# navigation actually happened. Returns False when it did not within the timeout.
+def wait_for_navigation(driver, site, old_element, timeout=None, old_url=None):
+    if old_element is None and old_url is None:
+        return True
+    try:
+        wait_until(driver, site, 'navigation', navigated(old_element, old_url), timeout)
+        return True
+    except TimeoutException:
+        logger.debug(f"{site}: previous page element never went stale")
+        return False
+
+
+def log_wait_stats():
+    report = wait_stats.report()
+    if report:
+        logger.info(f"Page readiness waits:\n{report}")
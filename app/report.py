@@ -0,0 +1,129 @@
+import csv
+import json
+
+from sqlalchemy import select, tuple_
+
+from .models import AmazonProduct, FlipOpportunity, Product, ProductMatch
+from .opportunities import MAX_BUY_BOX_COUNT, MIN_SELLERS
+
+CSV_COLUMNS = ['product_id', 'product_url', 'title', 'price', 'asin', 'amazon_url', 'amazon_buy_box_count', 'current_sellers']
+
+
+# Same page from the precomputed flip_opportunities, no join at all
+def _table_page_query(max_buy_box_count, min_sellers, after, page_size):
+    query = (
+        select(
+            FlipOpportunity.product_id.label('id'), FlipOpportunity.product_url, FlipOpportunity.title, FlipOpportunity.price,
+            FlipOpportunity.amazon_product_id, FlipOpportunity.asin, FlipOpportunity.amazon_url,
+            FlipOpportunity.amazon_buy_box_count, FlipOpportunity.current_sellers,
+        )
+        .where(
+            FlipOpportunity.amazon_buy_box_count < max_buy_box_count,
+            FlipOpportunity.current_sellers > min_sellers,
+        )
+        .order_by(FlipOpportunity.product_id.desc(), FlipOpportunity.amazon_product_id.desc())
+        .limit(page_size)
+    )
+    if after is not None:
+        query = query.where(tuple_(FlipOpportunity.product_id, FlipOpportunity.amazon_product_id) < after)
+    return query
+
+
+# One page of (product, Amazon match) rows after the keyset, newest products first.
+# All filters are in the single join, so no row is loaded only to be dropped in Python.
+def _join_page_query(max_buy_box_count, min_sellers, after, page_size):
+    query = (
+        select(
+            Product.id, Product.product_url, Product.title, Product.price,
+            AmazonProduct.id.label('amazon_product_id'), AmazonProduct.asin, AmazonProduct.product_url.label('amazon_url'),
+            AmazonProduct.amazon_buy_box_count, AmazonProduct.current_sellers,
+        )
+        .join(ProductMatch, ProductMatch.product_id == Product.id)
+        .join(AmazonProduct, AmazonProduct.id == ProductMatch.amazon_product_id)
+        .where(
+            Product.in_stock == True,
+            AmazonProduct.amazon_buy_box_count < max_buy_box_count,
+            AmazonProduct.current_sellers > min_sellers,
+        )
+        .order_by(Product.id.desc(), AmazonProduct.id.desc())
+        .limit(page_size)
+    )
+    if after is not None:
+        query = query.where(tuple_(Product.id, AmazonProduct.id) < after)
+    return query
+
+
+# Thresholds at least as strict as the flip_opportunities ones are served from that table
+def _page_query(max_buy_box_count, min_sellers, after, page_size):
+    if max_buy_box_count <= MAX_BUY_BOX_COUNT and min_sellers >= MIN_SELLERS:
+        return _table_page_query(max_buy_box_count, min_sellers, after, page_size)
+    return _join_page_query(max_buy_box_count, min_sellers, after, page_size)
+
+
+# Stream the in-stock products with Amazon matches under the thresholds, newest first, as dicts
+# {'product_id', 'product_url', 'title', 'price', 'amazon': [{'asin', 'url', ...}]}.
+# Pages are keyed on (product id, Amazon product id) and read through a server-side cursor,
+# so memory stays at one page whatever the catalog size.
+def iter_opportunities(session, max_buy_box_count=MAX_BUY_BOX_COUNT, min_sellers=MIN_SELLERS, page_size=1000):
+    current = None
+    after = None
+    while True:
+        result = session.execute(
+            _page_query(max_buy_box_count, min_sellers, after, page_size),
+            execution_options={'stream_results': True, 'yield_per': page_size},
+        )
+        rows = 0
+        for row in result:
+            rows += 1
+            after = (row.id, row.amazon_product_id)
+            # A product's matches are consecutive, possibly across pages
+            if current is None or current['product_id'] != row.id:
+                if current is not None:
+                    yield current
+                current = {'product_id': row.id, 'product_url': row.product_url, 'title': row.title, 'price': row.price, 'amazon': []}
+            current['amazon'].append({
+                'asin': row.asin,
+                'url': row.amazon_url,
+                'amazon_buy_box_count': row.amazon_buy_box_count,
+                'current_sellers': row.current_sellers,
+            })
+        result.close()
+        if rows < page_size:
+            break
+
+    if current is not None:
+        yield current
+
+
+# One CSV line per (product, Amazon match), written as the rows stream in
+def write_csv(opportunities, out):
+    writer = csv.writer(out)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    for item in opportunities:
+        for amazon in item['amazon']:
+            writer.writerow([
+                item['product_id'], item['product_url'], item['title'], item['price'],
+                amazon['asin'], amazon['url'], amazon['amazon_buy_box_count'], amazon['current_sellers'],
+            ])
+        count += 1
+    return count
+
+
+# A JSON array of products, written one element at a time
+def write_json(opportunities, out):
+    out.write('[')
+    count = 0
+    for item in opportunities:
+        out.write(',\n' if count else '\n')
+        json.dump(item, out, default=str)  # Decimal prices
+        count += 1
+    out.write('\n]\n' if count else ']\n')
+    return count
+
+
+WRITERS = {'csv': write_csv, 'json': write_json}
+
+
+def write_report(session, out, fmt='csv', **thresholds):
+    return WRITERS[fmt](iter_opportunities(session, **thresholds), out)
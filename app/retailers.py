@@ -0,0 +1,182 @@
+import logging
+import os
+
+from .browser import open_attached_tab
+from .db import SessionLocal
+from .detail_fetcher import DetailFetcher
+from .extraction import (
+    CVS_LISTING_CONTAINER, SAMSCLUB_LISTING_CONTAINER, WALGREENS_LISTING_CONTAINER,
+    cvs_listing_products, listing_container, parse, samsclub_detail, samsclub_listing_tiles,
+    walgreens_detail, walgreens_listing_tiles,
+)
+from .known_products import KnownProductIndex
+from .prices import parse_price
+from .readiness import wait_for_element
+
+logger = logging.getLogger(__name__)
+
+
+# What the scraping engine needs to know about one retailer.
+# parse_listing turns the parsed listing container into product dicts holding at least
+# 'product_url', plus 'price' and 'in_stock' when the tile shows them. Retailers whose tiles
+# already carry title, price and image leave parse_detail unset; the others get each product
+# page opened and run through parse_detail once detail_selector is on it. With http_details the product page is fetched over plain
+# HTTP first and the tab is only the fallback.
+class RetailerAdapter:
+    def __init__(self, name, source, listing_selector, parse_listing, detail_selector=None, parse_detail=None,
+                 listing_timeout=None, http_details=False):
+        self.name = name
+        self.source = source
+        self.listing_selector = listing_selector
+        self.parse_listing = parse_listing
+        self.detail_selector = detail_selector
+        self.parse_detail = parse_detail
+        self.listing_timeout = listing_timeout
+        self.detail_fetcher = DetailFetcher(name, parse_detail) if http_details and parse_detail else None
+
+
+# True when both price texts show the same amount ("$9.99" vs "Sale price $9.99 ea")
+def same_price(listed_price, known_price):
+    listed = parse_price(listed_price)[0]
+    return listed is not None and listed == parse_price(known_price)[0]
+
+
+ADAPTERS = {
+    'walgreens': RetailerAdapter(
+        'walgreens', 'walgreens', WALGREENS_LISTING_CONTAINER, walgreens_listing_tiles,
+        detail_selector='ul#thumbnailImages', parse_detail=walgreens_detail, listing_timeout=30,
+        # Set WALGREENS_HTTP_DETAILS=0 to always open product pages in the browser
+        http_details=os.getenv('WALGREENS_HTTP_DETAILS', '1') != '0',
+    ),
+    'cvs': RetailerAdapter('cvs', 'cvs', CVS_LISTING_CONTAINER, cvs_listing_products),
+    'samsclub': RetailerAdapter(
+        'samsclub', 'Sams Club', SAMSCLUB_LISTING_CONTAINER, samsclub_listing_tiles,
+        detail_selector='div.prod-price', parse_detail=samsclub_detail, listing_timeout=30,
+    ),
+}
+
+
+# Open a product page in the scraper's tab and extract it, None when it does not load
+def load_detail_in_tab(adapter, driver, product_url, retries=3):
+    for attempt in range(1, retries + 1):
+        try:
+            # Open the product details page
+            driver.get(product_url)
+            wait_for_element(driver, adapter.name, adapter.detail_selector)
+            return adapter.parse_detail(parse(driver.page_source))
+        except Exception:
+            print(f"Timeout reached for {product_url}. Retrying... {retries - attempt} attempt(s) left.")
+    print(f"Failed to load product details page after {retries} attempts. Skipping {product_url}.")
+    return None
+
+
+def _load_detail(adapter, driver, product_url):
+    if adapter.detail_fetcher:
+        return adapter.detail_fetcher.fetch(product_url, lambda: load_detail_in_tab(adapter, driver, product_url))
+    return load_detail_in_tab(adapter, driver, product_url)
+
+
+# Scrape one listing page of a retailer in its own tab. Known products only get their price and
+# stock refreshed in bulk; new ones are fed to the pipeline from build_pipeline(source, known_products)
+# for Amazon search, matching and persistence. claims is shared by parallel page workers so a
+# product listed on several pages is processed once. With incremental, a known product whose
+# listing tile shows the same price (or that is out of stock) never gets its detail page opened.
+# known_products is the run's KnownProductIndex of the source, shared by the page workers; without
+# it the page loads its own. Returns the new products.
+def scrape_listing_page(adapter, target_url, build_pipeline, claims=None, incremental=True, known_products=None):
+    # Attach to the existing Chrome session and open a new tab, quotes break some retailer URLs
+    driver = open_attached_tab(target_url.replace("'", "%27"))
+    print(f"Opened new {adapter.source} tab: {driver.current_url}")
+
+    product_pipeline = None
+    new_products = []
+    skipped_details = 0
+
+    try:
+        wait_for_element(driver, adapter.name, adapter.listing_selector, timeout=adapter.listing_timeout)
+
+        # Parse only the product list container once the JavaScript has loaded
+        products_list = listing_container(driver, adapter.listing_selector)
+        listed = adapter.parse_listing(products_list) if products_list is not None else []
+        if not listed:
+            print("No products found on the page.")
+            return []
+
+        if known_products is None:
+            known_products = KnownProductIndex(SessionLocal, adapter.source).load()
+        product_pipeline = build_pipeline(adapter.source, known_products)
+
+        print(f"Found {len(listed)} products on the page.")
+
+        for product in listed:
+            try:
+                product_url = product['product_url']
+                if not product_url:
+                    continue
+
+                # Skip products another page worker already took in this run
+                if claims is not None and not claims.claim(product_url):
+                    continue
+
+                existing_product = known_products.get(product_url)
+
+                # Incremental crawl: the listing tile already proves nothing changed, only touch the row
+                if incremental and existing_product and adapter.parse_detail:
+                    if not product.get('in_stock', True):
+                        known_products.mark_seen(product_url, existing_product.last_seen_price, in_stock=False)
+                        skipped_details += 1
+                        continue
+                    if same_price(product.get('price'), existing_product.last_seen_price):
+                        known_products.mark_seen(product_url, existing_product.last_seen_price)
+                        skipped_details += 1
+                        continue
+
+                if adapter.parse_detail:
+                    detail = _load_detail(adapter, driver, product_url)
+                    if detail is None:
+                        continue
+                    product = {
+                        'title': detail['title'],
+                        'price': detail['price'],
+                        'image_urls': detail['image_urls'],
+                        'product_url': product_url,
+                        'source': adapter.source,
+                    }
+
+                if existing_product:
+                    # Compare amounts, the HTTP and browser paths may format the same price differently
+                    if same_price(product['price'], existing_product.last_seen_price):
+                        print(f"Product with URL {product_url} already exists and the price is the same seting as in stock.")
+                        product['price'] = existing_product.last_seen_price
+                    else:
+                        print(f"Product with URL {product_url} already exists, updating the price.")
+                    # Queue the price/stock change, flushed in bulk
+                    known_products.mark_seen(product_url, product['price'])
+                    continue
+
+                print(f"Product: {product['title']}\nPrice: {product['price']}\nProduct URL: {product_url}")
+                new_products.append(product)
+
+                # Amazon search, match and persist run in the pipeline, the scraper moves on to the next product
+                product_pipeline.put(product)
+                print(10 * '-')
+            except Exception as e:
+                print(f"Error occurred while processing a product: {e}")
+                continue
+
+        if skipped_details:
+            print(f"Skipped {skipped_details} product pages unchanged on the listing.")
+        return new_products
+
+    except Exception as e:
+        print(f"Error occurred while scraping {adapter.source}: {e}")
+        return new_products
+    finally:
+        # Let the products already queued go through search, match and persist
+        if product_pipeline:
+            product_pipeline.close()
+        # Write any pending price/stock changes
+        if known_products is not None:
+            known_products.flush()
+        # Close only the current tab
+        driver.close()
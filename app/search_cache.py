@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# Spellings of the same size unit, mapped to one token
+UNIT_ALIASES = [
+    (r'fl\.?\s*oz\.?|fluid\s+ounces?', 'floz'),
+    (r'ounces?|oz\.?', 'oz'),
+    (r'counts?|ct\.?|pcs?\.?|pieces?', 'ct'),
+    (r'milligrams?|mg\.?', 'mg'),
+    (r'micrograms?|mcg\.?', 'mcg'),
+    (r'grams?|gm?\.?', 'g'),
+    (r'milliliters?|millilitres?|ml\.?', 'ml'),
+    (r'pounds?|lbs?\.?', 'lb'),
+    (r'international\s+units?|iu', 'iu'),
+]
+UNIT_PATTERNS = [(re.compile(rf'(\d+(?:\.\d+)?)\s*(?:{pattern})(?![a-z])'), unit) for pattern, unit in UNIT_ALIASES]
+
+
+# Normalize a product title into a cache key: case, accents, punctuation, whitespace and size units
+def normalize_title(title):
+    title = unicodedata.normalize('NFKD', title or '').encode('ascii', 'ignore').decode('ascii').lower()
+    title = title.replace('&', ' and ')
+    for pattern, unit in UNIT_PATTERNS:
+        title = pattern.sub(lambda m: f"{m.group(1)}{unit}", title)
+    title = re.sub(r'[^a-z0-9.]+', ' ', title)
+    title = re.sub(r'(?<!\d)\.|\.(?!\d)', ' ', title)
+    return ' '.join(title.split())
+
+
+# LRU + TTL cache of Amazon search results keyed by normalized title, persisted to a JSON file.
+# Concurrent lookups of the same key share one search. Writes are batched: the file is rewritten
+# after save_every new entries or save_interval seconds, and by close() for the rest.
+class SearchResultCache:
+    def __init__(self, path, max_entries=5000, ttl_seconds=7 * 24 * 3600, save_every=50, save_interval=60):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+        self._saved_at = time.time()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable Amazon search cache {self.path}: {e}")
+            return
+
+        now = time.time()
+        for key, entry in stored:
+            if now - entry['stored_at'] <= self.ttl_seconds:
+                self._entries[key] = entry
+        logger.info(f"Loaded {len(self._entries)} cached Amazon searches")
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            data = list(self._entries.items())
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            os.unlink(tmp_path)
+            logger.error(f"Error saving Amazon search cache: {e}")
+
+    def get(self, title):
+        key = normalize_title(title)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['stored_at'] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry['results']
+
+    def put(self, title, results):
+        key = normalize_title(title)
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {'stored_at': now, 'results': results}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            due = self._unsaved >= self.save_every or now - self._saved_at >= self.save_interval
+        if due:
+            self.flush()
+
+    # Write the entries added since the last save, one writer at a time
+    def flush(self):
+        with self._save_lock:
+            with self._lock:
+                if not self._unsaved:
+                    return
+                self._unsaved = 0
+                self._saved_at = time.time()
+            self._save()
+
+    def close(self):
+        self.flush()
+
+    # Return cached results for the title, or run search(title) once for all concurrent callers.
+    # Empty result lists are never cached, they usually mean the search failed.
+    def get_or_search(self, title, search):
+        key = normalize_title(title)
+        cached = self.get(title)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return cached
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            results = search(title)
+            if results:
+                self.put(title, results)
+            future.set_result(results)
+            return results
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'entries': len(self._entries)}
@@ -0,0 +1,106 @@
+import re
+
+import numpy as np
+
+from .search_cache import normalize_title
+
+NGRAM = 3
+DIM = 4096  # hashed n-gram buckets, power of two
+CHUNK = 512  # titles vectorized at once, bounds memory to CHUNK x DIM floats
+
+SIZE_UNITS = ('floz', 'oz', 'mg', 'mcg', 'g', 'ml', 'lb', 'iu')
+COUNT_RE = re.compile(r'\b(\d+)(?:ct\b|\s+(?:softgels?|capsules?|caplets?|tablets?|gummies|chewables?|lozenges?)\b)')
+SIZE_RE = re.compile(rf"\b(\d+(?:\.\d+)?)({'|'.join(SIZE_UNITS)})\b")
+
+# Penalties applied on top of the n-gram cosine when structured attributes disagree
+BRAND_MISMATCH_PENALTY = 0.25
+COUNT_MISMATCH_PENALTY = 0.3
+SIZE_MISMATCH_PENALTY = 0.2
+
+
+# Brand (first word), count ("100ct") and size tokens ("1000iu", "12floz") of a normalized title
+def title_attributes(normalized):
+    tokens = normalized.split()
+    return {
+        'brand': tokens[0] if tokens else '',
+        'counts': set(COUNT_RE.findall(normalized)),
+        'sizes': {f"{value}{unit}" for value, unit in SIZE_RE.findall(normalized)},
+    }
+
+
+# Hashed character n-gram TF vectors (L2 normalized) for many normalized titles at once
+def _vectorize(normalized_titles):
+    matrix = np.zeros((len(normalized_titles), DIM), dtype=np.float32)
+    if not normalized_titles:
+        return matrix
+
+    # Pad every title with spaces and join them, so n-grams never span two titles
+    padded = [f" {title} ".encode('ascii', 'ignore') for title in normalized_titles]
+    lengths = np.array([max(len(p) - NGRAM + 1, 0) for p in padded])
+    data = np.frombuffer(b''.join(p + b'\x00' * (NGRAM - 1) for p in padded), dtype=np.uint8).astype(np.uint32)
+
+    # Integer code of every n-gram in the joined buffer, then a multiplicative hash into DIM buckets
+    codes = np.zeros(len(data) - NGRAM + 1, dtype=np.uint32)
+    for offset in range(NGRAM):
+        codes = (codes << 8) | data[offset:len(data) - NGRAM + 1 + offset]
+    buckets = ((codes.astype(np.uint64) * np.uint64(2654435761)) >> np.uint64(12)) & np.uint64(DIM - 1)
+
+    # Keep only n-grams that start inside a title (not in the zero padding)
+    starts = np.concatenate(([0], np.cumsum([len(p) + NGRAM - 1 for p in padded])[:-1]))
+    keep = np.concatenate([np.arange(start, start + length) for start, length in zip(starts, lengths)]).astype(np.int64)
+    rows = np.repeat(np.arange(len(padded)), lengths)
+
+    flat = rows * DIM + buckets[keep].astype(np.int64)
+    matrix += np.bincount(flat, minlength=matrix.size).astype(np.float32).reshape(matrix.shape)
+    np.log1p(matrix, out=matrix)  # sublinear term frequency
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def _attribute_penalty(retail, amazon):
+    penalty = 0.0
+    if retail['brand'] and amazon['brand'] and retail['brand'] != amazon['brand']:
+        penalty += BRAND_MISMATCH_PENALTY
+    if retail['counts'] and amazon['counts'] and not retail['counts'] & amazon['counts']:
+        penalty += COUNT_MISMATCH_PENALTY
+    if retail['sizes'] and amazon['sizes'] and not retail['sizes'] & amazon['sizes']:
+        penalty += SIZE_MISMATCH_PENALTY
+    return penalty
+
+
+# Score many (retail title, Amazon title) pairs: n-gram cosine minus attribute mismatch penalties.
+# Returns a float array aligned with the input pairs, for backfills over thousands of pairs.
+def score_title_pairs(retail_titles, amazon_titles):
+    if len(retail_titles) != len(amazon_titles):
+        raise ValueError("retail_titles and amazon_titles must have the same length")
+
+    # Backfills repeat the same titles a lot, normalize and parse each distinct one once
+    normalized = {title: normalize_title(title) for title in set(retail_titles) | set(amazon_titles)}
+    attributes = {title: title_attributes(value) for title, value in normalized.items()}
+
+    scores = np.zeros(len(retail_titles), dtype=np.float32)
+    for start in range(0, len(retail_titles), CHUNK):
+        retail_chunk = retail_titles[start:start + CHUNK]
+        amazon_chunk = amazon_titles[start:start + CHUNK]
+        retail = [normalized[title] for title in retail_chunk]
+        amazon = [normalized[title] for title in amazon_chunk]
+        cosine = (_vectorize(retail) * _vectorize(amazon)).sum(axis=1)
+        penalties = np.array([
+            _attribute_penalty(attributes[r], attributes[a]) for r, a in zip(retail_chunk, amazon_chunk)
+        ], dtype=np.float32)
+        scores[start:start + len(retail)] = cosine - penalties
+    return np.clip(scores, 0.0, 1.0)
+
+
+# Rank Amazon search results against the retailer title, best first.
+# Returns [(1-based index into amazon_results, score)], dropping scores below min_score
+# and keeping at most `keep` candidates.
+def rank_candidates(retail_title, amazon_results, min_score=0.0, keep=None):
+    if not amazon_results:
+        return []
+    titles = [result.get('title') or '' for result in amazon_results]
+    scores = score_title_pairs([retail_title] * len(titles), titles)
+    order = np.argsort(-scores, kind='stable')
+    ranked = [(int(i) + 1, float(scores[i])) for i in order if scores[i] >= min_score]
+    return ranked[:keep] if keep else ranked
@@ -0,0 +1,71 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return hashlib.sha256(value).hexdigest()
+
+
+# Stable key of one visual match question: retailer image, Amazon image (URL or bytes) and prompt version.
+# None when either image is missing, such questions are not cached: they would all share one key.
+def verdict_key(retailer_image, amazon_image, prompt_version):
+    if not retailer_image or not amazon_image:
+        return None
+    raw = f"{_digest(retailer_image)}:{_digest(amazon_image)}:{prompt_version}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+# Persistent store of "is this Amazon image the same product as the retailer image" verdicts, in SQLite
+class VerdictCache:
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, is_match INTEGER NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    # Returns {key: bool} for the keys that have a stored verdict
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, is_match FROM verdicts WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+            verdicts = {key: bool(is_match) for key, is_match in rows}
+            self.hits += len(verdicts)
+            self.misses += len(set(keys)) - len(verdicts)
+        return verdicts
+
+    def put_many(self, verdicts):
+        if not verdicts:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (key, is_match, created_at) VALUES (?, ?, ?)",
+                [(key, int(is_match), now) for key, is_match in verdicts.items()],
+            )
+            self._conn.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,91 @@
+# Benchmark the NumPy buy box engine against the previous pandas implementation.
+#
+#   python benchmarks/bench_buybox.py [n_asins]
+#
+# Both implementations must return the same Amazon buy box day counts for every ASIN.
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.buybox import AMAZON_SELLER_ID, count_buy_box_days
+
+
+# Previous pandas implementation from main.py, kept here as the reference
+def keepaTimeMinutesToUnixTime(keepaMinutes):
+    return (21564000 + int(keepaMinutes)) * 60000
+
+
+def transformKeepaHistoryList(buy_box_seller_history):
+    return [(datetime.utcfromtimestamp(keepaTimeMinutesToUnixTime(keepaMinutes) / 1000), val) for
+                      keepaMinutes, val in zip(buy_box_seller_history[::2], buy_box_seller_history[1::2])]
+
+
+def fill_missing_days(df, last_n_days=90):
+    end_date = pd.Timestamp(datetime.utcnow().date())
+    start_date = end_date - timedelta(days=last_n_days)
+    all_dates = pd.date_range(start=start_date, end=end_date)
+    df['date'] = df['date'].dt.normalize()
+    df = df.drop_duplicates(subset='date', keep='last')
+    df.set_index('date', inplace=True)
+    df = df.reindex(all_dates, method='ffill').reset_index()
+    df.columns = ['date', 'seller']
+    return df
+
+
+def pandas_buy_box_count(buy_box_seller_history):
+    if not buy_box_seller_history:
+        return -1
+    buyboxhistory = transformKeepaHistoryList(buy_box_seller_history)
+    df_buyboxhistory = pd.DataFrame(buyboxhistory, columns=['date', 'seller'])
+    df_filled = fill_missing_days(df_buyboxhistory)
+    return df_filled['seller'].value_counts().get(AMAZON_SELLER_ID, 0)
+
+
+# Synthetic Keepa buyBoxSellerIdHistory lists covering the last year
+def make_histories(n_asins, seed=42):
+    rng = random.Random(seed)
+    now_minutes = int(datetime.utcnow().timestamp() // 60) - 21564000
+    sellers = [AMAZON_SELLER_ID, 'A1B2C3D4E5F6G7', 'A2ZZZZZZZZZZZZ', '-1']
+    histories = []
+    for _ in range(n_asins):
+        if rng.random() < 0.05:
+            histories.append([])
+            continue
+        minute = now_minutes - 365 * 1440
+        history = []
+        while minute < now_minutes:
+            history.extend([str(minute), rng.choice(sellers)])
+            minute += rng.randint(60, 5 * 1440)
+        histories.append(history)
+    return histories
+
+
+def main():
+    n_asins = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    histories = make_histories(n_asins)
+
+    start = time.perf_counter()
+    expected = [int(pandas_buy_box_count(history)) for history in histories]
+    pandas_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = count_buy_box_days(histories, last_n_days=90).tolist()
+    numpy_seconds = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"ASINs: {n_asins}")
+    print(f"pandas: {pandas_seconds:.3f}s ({n_asins / pandas_seconds:,.0f} ASINs/s)")
+    print(f"numpy:  {numpy_seconds:.3f}s ({n_asins / numpy_seconds:,.0f} ASINs/s)")
+    print(f"speedup: {pandas_seconds / numpy_seconds:.1f}x, mismatches: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Exercise the HTTP-first Walgreens detail fetcher against a local fixture server.
+#
+#   python benchmarks/bench_detail_fetcher.py [n_products] [browser_seconds]
+#
+# The server answers /jsonld/<i> with a JSON-LD product page, /markup/<i> with server-rendered
+# markup only, /empty/<i> with a page without product data and /blocked/<i> with a 403.
+# The last two must reach the fallback, which stands in for the Selenium tab and sleeps
+# browser_seconds. Every result is checked against the expected title and price.
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.detail_fetcher import DetailFetcher
+from app.extraction import walgreens_detail
+
+KINDS = ('jsonld', 'markup', 'empty', 'blocked')
+
+
+def expected_detail(i):
+    return {'title': f"Nature Made Fish Oil {i} Softgels", 'price': f"${i % 30}.99"}
+
+
+def jsonld_page(i):
+    product = {
+        '@context': 'https://schema.org',
+        '@type': 'Product',
+        'name': expected_detail(i)['title'],
+        'image': f"//pics.walgreens.com/{i}.jpg",
+        'offers': {'@type': 'Offer', 'price': f"{i % 30}.99", 'priceCurrency': 'USD'},
+    }
+    thumbnails = "".join(f"<li><img src=\"//pics.walgreens.com/{i}-{n}.jpg\"></li>" for n in range(4))
+    return (
+        f"<html><head><script type=\"application/ld+json\">{json.dumps(product)}</script></head>"
+        f"<body><div id=\"app\"></div><ul id=\"thumbnailImages\">{thumbnails}</ul></body></html>"
+    )
+
+
+def markup_page(i):
+    detail = expected_detail(i)
+    return (
+        f"<html><body><h1 id=\"productName\"><span>{detail['title']}</span></h1>"
+        f"<span id=\"sales-price\">Sale price {detail['price']}</span>"
+        f"<ul id=\"thumbnailImages\"><li><img src=\"//pics.walgreens.com/{i}.jpg\"></li></ul></body></html>"
+    )
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so the pooled connections are reused
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def do_GET(self):
+        _, kind, i = self.path.split('/')
+        i = int(i)
+        if kind == 'blocked':
+            self._reply(403, "<html><body>Access denied</body></html>")
+        elif kind == 'jsonld':
+            self._reply(200, jsonld_page(i))
+        elif kind == 'markup':
+            self._reply(200, markup_page(i))
+        else:
+            self._reply(200, "<html><body><div id=\"app\"></div></body></html>")
+
+    def _reply(self, status, body):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    n_products = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    browser_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    fetcher = DetailFetcher('walgreens', walgreens_detail, timeout=5)
+    fallbacks = []
+
+    def browser_fallback(url):
+        fallbacks.append(url)
+        time.sleep(browser_seconds)
+        i = int(url.rsplit('/', 1)[1])
+        return dict(expected_detail(i), regular_price="No regular price", image_urls=[])
+
+    def fetch(i):
+        url = f"{base_url}/{KINDS[i % len(KINDS)]}/{i}"
+        return i, fetcher.fetch(url, lambda: browser_fallback(url))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(fetch, range(n_products)))
+    elapsed = time.perf_counter() - start
+
+    wrong = [i for i, detail in results if {k: detail[k] for k in ('title', 'price')} != expected_detail(i)]
+    expected_fallbacks = sum(1 for i in range(n_products) if KINDS[i % len(KINDS)] in ('empty', 'blocked'))
+    stats = fetcher.stats()
+    fetcher.close()
+    server.shutdown()
+
+    print(f"products: {n_products}, elapsed {elapsed:.2f}s, wrong details: {len(wrong)}")
+    print(f"http: {stats['http']} at {stats['http_ms_avg']:.1f} ms avg, fallbacks: {stats['fallbacks']} "
+          f"(expected {expected_fallbacks}) {stats['fallback_reasons']}")
+    if wrong or len(fallbacks) != expected_fallbacks:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
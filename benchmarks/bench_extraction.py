@@ -0,0 +1,262 @@
+# Benchmark the lxml extraction layer against the BeautifulSoup parsing it replaced.
+#
+#   python benchmarks/bench_extraction.py <page_kind> page.html [page.html ...]
+#   python benchmarks/bench_extraction.py --synthetic [n_tiles]
+#
+# page_kind is one of walgreens_listing, walgreens_detail, cvs_listing, samsclub_listing,
+# samsclub_detail. Save pages from a scraping session with driver.page_source. Both
+# implementations get the full page here; in the scrapers listing pages only hand the
+# product container's outerHTML to lxml, so the real gain on listings is larger.
+import os
+import random
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import extraction
+
+CVS_TITLE_CLASS = 'css-901oao css-cens5h r-b0vftf r-1xaesmv r-ubezar r-majxgm r-29m4ib r-rjixqe r-1bymd8e r-fdjqy7 r-13qz1uu'
+
+
+# Reference implementations: the BeautifulSoup code from the scrapers
+def bs4_walgreens_listing(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    products_list = soup.find('ul', class_='product-container')
+    if not products_list:
+        return []
+    return ['https://www.walgreens.com' + product.find('a', href=True)['href'] for product in products_list.find_all('li', class_='item owned-brands')]
+
+
+def bs4_walgreens_detail(content):
+    product_soup = BeautifulSoup(content, 'html.parser')
+    product_name_h1 = product_soup.find('h1', id='productName')
+    regular_price_div = product_soup.find('div', id='regular-price-wag-hn-lt-bold')
+    sales_price_div = product_soup.find('span', id='sales-price')
+
+    image_urls = []
+    image_div = product_soup.find('div', style=lambda s: 'background-image' in s if s else False)
+    if image_div:
+        image_url = image_div['style'].split('url(')[-1].split(')')[0].replace('"', '').replace("'", "")
+        if image_url.startswith("//"):
+            image_url = f"https:{image_url}"
+        image_urls.append(image_url)
+    thumbnails = product_soup.find('ul', id='thumbnailImages')
+    if thumbnails:
+        for li in thumbnails.find_all('li'):
+            img_tag = li.find('img')
+            if img_tag and img_tag.get('src'):
+                image_urls.append(f"https:{img_tag['src']}")
+
+    return {
+        'title': " ".join(product_name_h1.stripped_strings) if product_name_h1 else "No title found",
+        'regular_price': regular_price_div.text.strip().replace('old price', '').strip() if regular_price_div else "No regular price",
+        'price': sales_price_div.text.strip().replace('Sale price', '').strip() if sales_price_div else "No sales price",
+        'image_urls': image_urls,
+    }
+
+
+def bs4_cvs_listing(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    products = []
+    for product in soup.find_all('div', class_='css-1dbjc4n r-18u37iz r-tzz3ar'):
+        title_div = product.find('div', class_=CVS_TITLE_CLASS)
+        img_tag = product.find('img', class_='PLP-tile-image')
+        image_url = img_tag['src'] if img_tag else ''
+        if image_url.startswith("//"):
+            image_url = f"https:{image_url}"
+        price_div = product.find('div', class_='css-901oao', attrs={'aria-label': lambda x: x and 'Price' in x})
+        product_link_tag = product.find('a', href=True)
+        products.append({
+            'title': title_div.text.strip() if title_div else "No title found",
+            'price': price_div.text.strip() if price_div else "No price found",
+            'image_urls': [image_url],
+            'product_url': 'https://www.cvs.com' + product_link_tag['href'] if product_link_tag else "No URL found",
+            'source': 'cvs',
+        })
+    return products
+
+
+def bs4_samsclub_listing(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    return ['https://www.samsclub.com' + product.find('a', href=True)['href'] for product in soup.find_all('div', class_='sc-product-card')]
+
+
+def bs4_samsclub_detail(content):
+    product_soup = BeautifulSoup(content, 'html.parser')
+    product_name_h1 = product_soup.find('h1', class_='sc-product-title')
+    regular_price_div = product_soup.find('span', class_='prod-price-old')
+    sales_price_div = product_soup.find('span', class_='prod-price-primary')
+    image_urls = []
+    image_div = product_soup.find('img', class_='sc-product-image')
+    if image_div:
+        image_url = image_div['src']
+        if image_url.startswith("//"):
+            image_url = f"https:{image_url}"
+        image_urls.append(image_url)
+    return {
+        'title': " ".join(product_name_h1.stripped_strings) if product_name_h1 else "No title found",
+        'regular_price': regular_price_div.text.strip().replace('old price', '').strip() if regular_price_div else "No regular price",
+        'price': sales_price_div.text.strip().replace('Sale price', '').strip() if sales_price_div else "No sales price",
+        'image_urls': image_urls,
+    }
+
+
+# The scrapers read whole tiles (URL, price, stock); the reference only had the URLs
+def _tile_urls(listing_tiles):
+    return lambda root: [tile['product_url'] for tile in listing_tiles(root)]
+
+
+PAGE_KINDS = {
+    'walgreens_listing': (bs4_walgreens_listing, _tile_urls(extraction.walgreens_listing_tiles)),
+    'walgreens_detail': (bs4_walgreens_detail, extraction.walgreens_detail),
+    'cvs_listing': (bs4_cvs_listing, extraction.cvs_listing_products),
+    'samsclub_listing': (bs4_samsclub_listing, _tile_urls(extraction.samsclub_listing_tiles)),
+    'samsclub_detail': (bs4_samsclub_detail, extraction.samsclub_detail),
+}
+
+
+# Generated nodes around the products, the generated-class noise CVS pages are full of
+def _noise(depth=3, width=4):
+    if depth == 0:
+        return f"<span class=\"css-901oao r-{random.randint(0, 1 << 20):x}\">filler {random.random():.4f}</span>"
+    inner = "".join(_noise(depth - 1, width) for _ in range(width))
+    return f"<div class=\"css-1dbjc4n r-{random.randint(0, 1 << 20):x} r-{random.randint(0, 1 << 20):x}\">{inner}</div>"
+
+
+CVS_NESTED_SUPERSET = '<div class="css-1dbjc4n r-18u37iz r-tzz3ar r-1wtj0ep"><span>Sponsored</span></div>'
+
+
+def synthetic_pages(n_tiles):
+    noise = "".join(_noise() for _ in range(n_tiles // 4 + 1))
+    # Every 5th tile also carries an element whose classes are a superset of the tile's: the old
+    # code matched the exact class string and skipped them, so must the lxml selectors
+    walgreens_tiles = "".join(
+        f"<li class=\"item owned-brands{' sponsored' if i % 5 == 0 else ''}\"><div><a href=\"/store/c/product-{i}/ID=prod{i}-product\"><img src=\"//pics.walgreens.com/{i}.jpg\"></a></div></li>"
+        for i in range(n_tiles)
+    )
+    cvs_tiles = "".join(
+        f"<div class=\"css-1dbjc4n r-18u37iz r-tzz3ar\"><a href=\"/shop/product-{i}-prodid-{i}\">"
+        f"<img class=\"PLP-tile-image\" src=\"//www.cvs.com/bizcontent/{i}.jpg\"></a>"
+        f"<div class=\"{CVS_TITLE_CLASS}\"> Nature Made Vitamin D3 {i} Softgels </div>"
+        f"<div class=\"css-901oao r-1jn44m2\" aria-label=\"Price ${i % 30}.99\">${i % 30}.99</div>{_noise(2)}"
+        f"{CVS_NESTED_SUPERSET if i % 5 == 0 else ''}</div>"
+        for i in range(n_tiles)
+    )
+    samsclub_tiles = "".join(
+        f"<div class=\"sc-product-card\"><a href=\"/p/product-{i}/prod{i}\"><img src=\"//scene7.samsclub.com/{i}\"></a></div>"
+        for i in range(n_tiles)
+    )
+    thumbnails = "".join(f"<li><img src=\"//pics.walgreens.com/thumb-{i}.jpg\"></li>" for i in range(6))
+    return {
+        'walgreens_listing': [f"<html><body>{noise}<ul class=\"product-container\">{walgreens_tiles}</ul>{noise}</body></html>"],
+        'walgreens_detail': [
+            f"<html><body>{noise}<h1 id=\"productName\"><span>Nature Made</span> <span>Fish Oil 1200 mg</span> <span>100 ea</span></h1>"
+            f"<div id=\"regular-price-wag-hn-lt-bold\">old price $19.99</div><span id=\"sales-price\">Sale price $9.99</span>"
+            f"<div style=\"background-image: url('//pics.walgreens.com/main.jpg')\"></div><ul id=\"thumbnailImages\">{thumbnails}</ul>{noise}</body></html>"
+        ],
+        'cvs_listing': [f"<html><body><div id=\"root\">{noise}<div>{cvs_tiles}</div>{noise}</div></body></html>"],
+        'samsclub_listing': [f"<html><body>{noise}<div class=\"sc-plp-cards sc-plp-cards-grid\">{samsclub_tiles}</div>{noise}</body></html>"],
+        'samsclub_detail': [
+            f"<html><body>{noise}<h1 class=\"sc-product-title\">Member's Mark <span>Vitamin C</span></h1>"
+            f"<span class=\"prod-price-old\">$24.98</span><span class=\"prod-price-primary\">$18.98</span>"
+            f"<img class=\"sc-product-image\" src=\"//scene7.samsclub.com/main\">{noise}</body></html>"
+        ],
+    }
+
+
+# Listing tiles behind the incremental crawl's skip decision: tile price, availability badge, and
+# stock-like words outside the badge (promotions, a variant sold out online) that must not count
+TILE_FIXTURES = {
+    'walgreens': (
+        extraction.walgreens_listing_tiles,
+        '<ul class="product-container">'
+        '<li class="item owned-brands"><a href="/store/c/a/ID=prod1-product">A</a>'
+        '<div class="product__price"><span>$9.99</span> <span>Sale</span></div></li>'
+        '<li class="item owned-brands"><a href="/store/c/b/ID=prod2-product">B</a>'
+        '<div class="product__price">$4.49</div><span class="product__availability"> Out of stock </span></li>'
+        '<li class="item owned-brands"><a href="/store/c/c/ID=prod3-product">C</a>'
+        '<div class="product__price">2 for $5.00</div><p>Last chance before it is sold out!</p>'
+        '<span class="product__availability">In stock</span></li>'
+        '<li class="item owned-brands"><a href="/store/c/d/ID=prod4-product">D</a></li>'
+        '</ul>',
+        [
+            {'product_url': 'https://www.walgreens.com/store/c/a/ID=prod1-product', 'price': '$9.99 Sale', 'in_stock': True},
+            {'product_url': 'https://www.walgreens.com/store/c/b/ID=prod2-product', 'price': '$4.49', 'in_stock': False},
+            {'product_url': 'https://www.walgreens.com/store/c/c/ID=prod3-product', 'price': '2 for $5.00', 'in_stock': True},
+            {'product_url': 'https://www.walgreens.com/store/c/d/ID=prod4-product', 'price': None, 'in_stock': True},
+        ],
+    ),
+    'samsclub': (
+        extraction.samsclub_listing_tiles,
+        '<div class="sc-plp-cards sc-plp-cards-grid">'
+        '<div class="sc-product-card"><a href="/p/a/prod1">A</a><div class="Price-group"><span>$18.98</span></div></div>'
+        '<div class="sc-product-card"><a href="/p/b/prod2">B</a><span class="sc-price">$7.48</span>'
+        '<div class="sc-pc-availability">Sold out</div></div>'
+        '<div class="sc-product-card"><a href="/p/c/prod3">C</a><span class="sc-price">$12.00</span>'
+        '<div class="sc-pc-variants">Blue: sold out online</div><div class="sc-pc-availability">Sold out online</div></div>'
+        '</div>',
+        [
+            {'product_url': 'https://www.samsclub.com/p/a/prod1', 'price': '$18.98', 'in_stock': True},
+            {'product_url': 'https://www.samsclub.com/p/b/prod2', 'price': '$7.48', 'in_stock': False},
+            {'product_url': 'https://www.samsclub.com/p/c/prod3', 'price': '$12.00', 'in_stock': True},
+        ],
+    ),
+}
+
+
+# Assert the *_listing_tiles output on the fixtures, returns the number of failures
+def check_tile_fixtures():
+    failures = 0
+    for retailer, (listing_tiles, markup, expected) in TILE_FIXTURES.items():
+        actual = listing_tiles(extraction.parse(markup))
+        if actual != expected:
+            failures += 1
+            print(f"{retailer} listing tiles differ:\n  expected {expected}\n  actual   {actual}")
+        else:
+            print(f"{retailer} listing tiles: {len(actual)} tiles as expected")
+    return failures
+
+
+def _timed(func, pages, repeat):
+    results = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [func(page) for page in pages]
+    return results, (time.perf_counter() - start) / (repeat * len(pages))
+
+
+def run(kind, pages, repeat=5):
+    reference, fast = PAGE_KINDS[kind]
+    expected, bs4_seconds = _timed(reference, pages, repeat)
+    actual, lxml_seconds = _timed(lambda page: fast(extraction.parse(page)), pages, repeat)
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    size = sum(len(page) for page in pages) / len(pages) / 1024
+    print(
+        f"{kind}: {len(pages)} page(s), {size:.0f} KiB avg, html.parser {bs4_seconds * 1000:.1f} ms/page, "
+        f"lxml {lxml_seconds * 1000:.1f} ms/page, {bs4_seconds / lxml_seconds:.1f}x faster, {mismatches} mismatches"
+    )
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--synthetic':
+        n_tiles = int(sys.argv[2]) if len(sys.argv) > 2 else 72
+        random.seed(0)
+        for kind, pages in synthetic_pages(n_tiles).items():
+            run(kind, pages)
+        sys.exit(1 if check_tile_fixtures() else 0)
+
+    if len(sys.argv) < 3 or sys.argv[1] not in PAGE_KINDS:
+        print(f"usage: {sys.argv[0]} <{'|'.join(PAGE_KINDS)}> page.html [page.html ...] | --synthetic [n_tiles]")
+        sys.exit(1)
+    pages = []
+    for path in sys.argv[2:]:
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    run(sys.argv[1], pages)
+
+
+if __name__ == "__main__":
+    main()
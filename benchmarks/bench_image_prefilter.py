@@ -0,0 +1,145 @@
+# Benchmark the perceptual hash image prefilter against the LLM-only matcher.
+#
+#   python benchmarks/bench_image_prefilter.py cases.json
+#   python benchmarks/bench_image_prefilter.py --synthetic [n_cases]
+#
+# A fixture file records what the LLM answered for real products:
+#
+#   {"cases": [{"retailer_image": "walgreens/123.jpg",
+#               "candidates": ["amazon/B000001.jpg", ...],
+#               "llm_matches": [2, 5]}]}
+#
+# Thresholds come from IMAGE_PREFILTER_REJECT_BELOW / IMAGE_PREFILTER_ACCEPT_ABOVE like in main.py.
+# Image paths are relative to the fixture file (URLs work too), llm_matches are 1-based like
+# find_matching_amazon_images returns. The LLM answer is the ground truth; the report shows
+# how many candidates still need the LLM and the precision/recall of the prefilter pipeline
+# (prefilter accepts + LLM on the ambiguous band) against it.
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.image_prefilter import prefilter_candidates, prefilter_thresholds
+
+
+def load_cases(path):
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(source):
+        if source.startswith(('http://', 'https://', '//')):
+            return source
+        return os.path.join(base, source)
+
+    with open(path) as f:
+        cases = json.load(f)['cases']
+    for case in cases:
+        case['retailer_image'] = resolve(case['retailer_image'])
+        case['candidates'] = [resolve(source) for source in case['candidates']]
+    return cases
+
+
+# Product-like picture: a coloured bottle with a label and some text bars on white
+def _product_image(rng, size=300):
+    image = Image.new('RGB', (size, size), 'white')
+    draw = ImageDraw.Draw(image)
+    body = tuple(rng.randint(0, 255) for _ in range(3))
+    label = tuple(rng.randint(0, 255) for _ in range(3))
+    left, right = rng.randint(60, 110), rng.randint(190, 240)
+    top = rng.randint(30, 80)
+    draw.rectangle([left, top, right, size - 20], fill=body)
+    draw.rectangle([left + 10, top + 60, right - 10, top + 150], fill=label)
+    for _ in range(rng.randint(2, 5)):
+        y = rng.randint(top + 70, top + 140)
+        draw.rectangle([left + 20, y, right - rng.randint(20, 60), y + 6], fill=(0, 0, 0))
+    return image
+
+
+# The same product as a marketplace listing would show it: rescaled, recompressed, slightly shifted
+def _listing_variant(rng, image):
+    size = rng.randint(160, 500)
+    variant = image.resize((size, size))
+    shift = rng.randint(0, 6)
+    variant = variant.crop((shift, shift, size, size)).resize((size, size))
+    if rng.random() < 0.5:
+        variant = variant.filter(ImageFilter.GaussianBlur(rng.random()))
+    buffer = io.BytesIO()
+    variant.save(buffer, 'JPEG', quality=rng.randint(60, 95))
+    return Image.open(io.BytesIO(buffer.getvalue())).convert('RGB')
+
+
+def synthetic_cases(n_cases, directory, seed=7):
+    rng = random.Random(seed)
+    cases = []
+    for case_index in range(n_cases):
+        product = _product_image(rng)
+        retailer_path = os.path.join(directory, f"{case_index}_retail.png")
+        product.save(retailer_path)
+
+        candidates, matches = [], []
+        for position in range(1, 11):
+            if rng.random() < 0.2:
+                image = _listing_variant(rng, product)
+                matches.append(position)
+            else:
+                image = _product_image(rng)
+            path = os.path.join(directory, f"{case_index}_{position}.jpg")
+            image.save(path, 'JPEG', quality=90)
+            candidates.append(path)
+        cases.append({'retailer_image': retailer_path, 'candidates': candidates, 'llm_matches': matches})
+    return cases
+
+
+def evaluate(cases):
+    true_positive = false_positive = false_negative = 0
+    accepted_total = rejected_total = ambiguous_total = candidates_total = 0
+    llm_calls = 0
+    reject_below, accept_above = prefilter_thresholds()
+    start = time.perf_counter()
+
+    for case in cases:
+        truth = set(case['llm_matches'])
+        accepted, ambiguous, rejected, _ = prefilter_candidates(case['retailer_image'], case['candidates'], reject_below=reject_below, accept_above=accept_above)
+
+        # The ambiguous band is still answered by the LLM, i.e. the recorded verdicts
+        predicted = {i + 1 for i in accepted} | {i + 1 for i in ambiguous if i + 1 in truth}
+        true_positive += len(predicted & truth)
+        false_positive += len(predicted - truth)
+        false_negative += len(truth - predicted)
+
+        accepted_total += len(accepted)
+        rejected_total += len(rejected)
+        ambiguous_total += len(ambiguous)
+        candidates_total += len(case['candidates'])
+        llm_calls += 1 if ambiguous else 0
+
+    elapsed = time.perf_counter() - start
+    precision = true_positive / (true_positive + false_positive) if true_positive + false_positive else 1.0
+    recall = true_positive / (true_positive + false_negative) if true_positive + false_negative else 1.0
+
+    print(f"cases: {len(cases)}, candidates: {candidates_total}, thresholds: reject < {reject_below}, accept >= {accept_above}")
+    print(f"accepted: {accepted_total}, rejected: {rejected_total}, ambiguous (sent to LLM): {ambiguous_total}")
+    print(f"LLM calls: {llm_calls} vs {len(cases)} LLM-only ({len(cases) / max(llm_calls, 1):.1f}x fewer), "
+          f"images sent: {ambiguous_total} vs {candidates_total}")
+    print(f"precision: {precision:.3f}, recall: {recall:.3f} against the LLM-only verdicts")
+    print(f"prefilter time: {elapsed:.2f}s ({elapsed / max(len(cases), 1) * 1000:.0f} ms per product)")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] != '--synthetic':
+        evaluate(load_cases(sys.argv[1]))
+        return
+
+    n_cases = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with tempfile.TemporaryDirectory() as directory:
+        evaluate(synthetic_cases(n_cases, directory))
+
+
+if __name__ == "__main__":
+    main()
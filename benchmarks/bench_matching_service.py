@@ -0,0 +1,88 @@
+# Load-test the async LLM matching service against a local fake OpenAI endpoint.
+#
+#   python benchmarks/bench_matching_service.py [n_jobs] [concurrency] [error_rate]
+#
+# The fake endpoint answers /v1/chat/completions after a random delay and fails a share of
+# requests with 429/500, so concurrency, retries and latency stats can be checked offline.
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.matching_service import MatchingService
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    error_rate = 0.1
+    min_delay = 0.2
+    max_delay = 1.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(random.uniform(self.min_delay, self.max_delay))
+
+        if random.random() < self.error_rate:
+            status = random.choice([429, 500, 503])
+            self._reply(status, {'error': {'message': 'fake failure', 'type': 'server_error', 'code': status}})
+            return
+
+        images = sum(1 for part in body['messages'][0]['content'] if part['type'] == 'image_url') - 1
+        matches = sorted(random.sample(range(1, images + 1), k=min(images, random.randint(0, 2))))
+        self._reply(200, {
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': json.dumps(matches)}, 'finish_reason': 'stop'}],
+        })
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    n_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    FakeOpenAIHandler.error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    service = MatchingService(concurrency=concurrency, base_url=base_url, api_key='fake', base_delay=0.2, max_delay=2.0)
+    images = [f"https://example.com/{i}.jpg" for i in range(10)]
+
+    start = time.perf_counter()
+    futures = [service.submit("https://example.com/retail.jpg", images) for _ in range(n_jobs)]
+    failed = 0
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            failed += 1
+    elapsed = time.perf_counter() - start
+
+    stats = service.stats()
+    service.close()
+    server.shutdown()
+
+    print(f"jobs: {n_jobs}, concurrency: {concurrency}, error rate: {FakeOpenAIHandler.error_rate}")
+    print(f"elapsed: {elapsed:.2f}s, {n_jobs / elapsed:.1f} jobs/sec, failed after retries: {failed}")
+    print(f"retries: {stats['retries']}, latency p50 {stats.get('p50', 0):.2f}s, p95 {stats.get('p95', 0):.2f}s, max {stats.get('max', 0):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Query-performance regression check for the hot queries on a synthetic ~1M row catalog.
+#
+#   BENCH_DATABASE_URL=postgresql://oa:oa@localhost:5432/oa_bench python benchmarks/bench_queries.py --seed
+#   BENCH_DATABASE_URL=... python benchmarks/bench_queries.py
+#
+# Point BENCH_DATABASE_URL at a scratch database: --seed drops and recreates every table there.
+# The seed writes 300k products, 200k Amazon products and 500k matches with generate_series,
+# fills flip_opportunities and runs VACUUM ANALYZE. Each hot query is then run under
+# EXPLAIN (ANALYZE, FORMAT JSON): the plan has to use the index the query was designed around
+# and the best of three runs has to fit its budget (scaled by BENCH_BUDGET_SCALE, default 1).
+# Exits non-zero when a check fails. benchmarks/test_queries.py runs the same checks under pytest.
+import os
+import sys
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.enrichment import candidate_page_query
+from app.known_products import known_products_query
+from app.models import AmazonProduct, Base
+from app.opportunities import MAX_BUY_BOX_COUNT, MIN_SELLERS, _opportunity_rows, rebuild
+from app.report import _join_page_query, _table_page_query
+
+N_PRODUCTS = 300_000
+N_AMAZON = 200_000
+N_MATCHES = 500_000
+
+SEED_SQL = [
+    f"""
+    INSERT INTO products (title, image_urls, product_url, source, last_seen_price, price, currency, in_stock, created_date, updated_date)
+    SELECT 'Product ' || i, ARRAY['https://example.com/' || i || '.jpg'], 'https://example.com/p/' || i,
+           CASE WHEN i % 20 = 0 THEN 'Sams Club' WHEN i % 3 = 0 THEN 'cvs' ELSE 'walgreens' END,
+           '$' || (i % 50) || '.99', (i % 50) + 0.99, 'USD', i % 4 <> 0, now(), now()
+    FROM generate_series(1, {N_PRODUCTS}) AS i
+    """,
+    f"""
+    INSERT INTO amazon_products (asin, title, product_url, image_url, amazon_buy_box_count, current_sellers, created_date, updated_date)
+    SELECT 'B' || lpad(i::text, 9, '0'), 'Amazon product ' || i, 'https://www.amazon.com/dp/B' || lpad(i::text, 9, '0'),
+           'https://m.media-amazon.com/' || i || '.jpg',
+           CASE WHEN i % 40 = 0 THEN NULL WHEN i % 41 = 0 THEN -1 ELSE (i::bigint * 7919) % 91 END,
+           (i::bigint * 104729) % 12, now(), now()
+    FROM generate_series(1, {N_AMAZON}) AS i
+    """,
+    f"""
+    INSERT INTO product_matches (product_id, amazon_product_id, created_date, updated_date)
+    SELECT DISTINCT ON (p, a) p, a, now(), now()
+    FROM (
+        SELECT 1 + (i * 2654435761) % {N_PRODUCTS} AS p, 1 + (i::bigint * 40503) % {N_AMAZON} AS a
+        FROM generate_series(1, {N_MATCHES}) AS i
+    ) pairs
+    """,
+]
+
+COMPILE = {'dialect': postgresql.dialect(), 'compile_kwargs': {'literal_binds': True}}
+
+
+def _sql(statement):
+    return str(statement.compile(**COMPILE))
+
+
+def hot_queries():
+    some_amazon_ids = list(range(1, N_AMAZON, N_AMAZON // 100))
+    return [
+        # (name, SQL, index the plan must use, budget in ms)
+        ('scrape: load known products of a source', _sql(known_products_query('Sams Club')), 'ix_products_source', 30),
+        ('enrich: next page of unanalyzed Amazon products', _sql(candidate_page_query(0, 1000)), 'ix_amazon_products_unanalyzed', 10),
+        ('report: first page over the join', _sql(_join_page_query(MAX_BUY_BOX_COUNT, MIN_SELLERS, None, 1000)), 'ix_products_in_stock_id', 100),
+        ('report: first page from flip_opportunities', _sql(_table_page_query(MAX_BUY_BOX_COUNT, MIN_SELLERS, None, 1000)), 'flip_opportunities_pkey', 20),
+        (
+            'opportunities: refresh after Keepa updated 100 Amazon products',
+            _sql(_opportunity_rows().where(AmazonProduct.id.in_(some_amazon_ids))),
+            'ix_product_matches_amazon_product_id', 20,
+        ),
+        (
+            'opportunities: top 100',  # top_opportunities()
+            "SELECT * FROM flip_opportunities ORDER BY amazon_buy_box_count, product_id DESC LIMIT 100",
+            'ix_flip_opportunities_rank', 5,
+        ),
+    ]
+
+
+def _index_names(plan):
+    names = set()
+    if 'Index Name' in plan:
+        names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        names |= _index_names(child)
+    return names
+
+
+# Best execution time in ms of `runs` EXPLAIN ANALYZE runs and the indexes the plan uses
+def explain(session, sql, runs=3):
+    timings = []
+    for _ in range(runs):
+        plan = session.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")).scalar()[0]
+        timings.append(plan['Execution Time'])
+    return min(timings), _index_names(plan['Plan'])
+
+
+def seed(engine):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for statement in SEED_SQL:
+            connection.execute(text(statement))
+    with Session(engine) as session:
+        rebuild(session)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text("VACUUM ANALYZE"))
+    print("Seeded the synthetic catalog")
+
+
+def main():
+    url = os.getenv('BENCH_DATABASE_URL')
+    if not url:
+        print("Set BENCH_DATABASE_URL to a scratch Postgres database, it gets dropped and reseeded with --seed")
+        sys.exit(1)
+    scale = float(os.getenv('BENCH_BUDGET_SCALE', 1))
+    engine = create_engine(url)
+    if '--seed' in sys.argv:
+        seed(engine)
+
+    failures = 0
+    with Session(engine) as session:
+        for name, sql, index, budget_ms in hot_queries():
+            best, indexes = explain(session, sql)
+            ok = index in indexes and best <= budget_ms * scale
+            failures += not ok
+            print(
+                f"{'ok  ' if ok else 'FAIL'} {name}: {best:.1f} ms (budget {budget_ms * scale:.0f} ms), "
+                f"indexes {sorted(indexes) or 'none'}{'' if index in indexes else f', expected {index}'}"
+            )
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
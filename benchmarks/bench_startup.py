@@ -0,0 +1,110 @@
+# Startup time of the main.py subcommands, each in a fresh interpreter.
+#
+#   python benchmarks/bench_startup.py [--runs 10]
+#
+# `report` is run end to end against a throwaway SQLite database holding an empty flip_opportunities
+# table, so the number is the cron job's fixed cost: interpreter, imports, engine and one query.
+# The other subcommands are timed up to argument parsing (--help), they do real work after that.
+# The eager baseline imports what main.py used to import at the top before any subcommand ran.
+# Every optional cache is enabled (KEEPA_CACHE_DIR, AMAZON_SEARCH_CACHE_PATH with a full search
+# cache file, MATCH_VERDICT_CACHE_PATH), as in production. Fails when `report` loads one of the
+# browser / LLM / Keepa / numpy libraries or opens one of those caches.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from app.models import FlipOpportunity
+
+HEAVY = ['selenium', 'openai', 'keepa', 'numpy', 'pandas', 'bs4', 'lxml', 'PIL']
+
+EAGER_BASELINE = (
+    "import openai, keepa, numpy, sqlalchemy.orm, selenium.webdriver, selenium.webdriver.chrome.options, "
+    "selenium.webdriver.support.ui, selenium.webdriver.support.expected_conditions"
+)
+
+# Runs main.main(argv) and reports which heavy libraries ended up imported
+REPORT_HEAVY = (
+    "import sys, main; main.main(sys.argv[1:]); "
+    f"print('HEAVY:' + ','.join(m for m in {HEAVY!r} if m in sys.modules), file=sys.stderr)"
+)
+
+
+def _time(argv, runs, env):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(argv, cwd=ROOT, env=env, capture_output=True, text=True)
+        timings.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stderr}")
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'report.db')}"
+        engine = create_engine(database_url)
+        FlipOpportunity.__table__.create(engine)
+        engine.dispose()
+        # A full search cache (5000 titles x 10 results) that report must not read
+        search_cache_path = os.path.join(tmp, 'search_cache.json')
+        with open(search_cache_path, 'w') as f:
+            json.dump([
+                [f"title {i}", {'stored_at': time.time(), 'results': [{'url': f"https://www.amazon.com/dp/B{i:09d}", 'title': f"Amazon {i}", 'image_url': ''}] * 10}]
+                for i in range(5000)
+            ], f)
+        keepa_cache_dir = os.path.join(tmp, 'keepa_cache')
+        verdict_cache_path = os.path.join(tmp, 'verdicts', 'verdicts.db')
+        env = dict(
+            os.environ, DATABASE_URL=database_url, DB_CREATE_SCHEMA='0', KEEPA_CACHE_DIR=keepa_cache_dir,
+            AMAZON_SEARCH_CACHE_PATH=search_cache_path, MATCH_VERDICT_CACHE_PATH=verdict_cache_path,
+        )
+
+        cases = [
+            ('eager imports (old main.py)', [sys.executable, '-c', EAGER_BASELINE]),
+            ('report (end to end)', [sys.executable, '-c', REPORT_HEAVY, 'report', '--output', os.devnull]),
+        ] + [
+            (f"{command} --help", [sys.executable, 'main.py', command] + (['walgreens'] if command == 'scrape' else []) + ['--help'])
+            for command in ('scrape', 'enrich', 'match')
+        ]
+
+        failed = False
+        for name, argv in cases:
+            try:
+                median, result = _time(argv, args.runs, env)
+            except RuntimeError as e:
+                # The eager baseline needs every optional library installed
+                print(f"{name}: skipped, {str(e).strip().splitlines()[-1]}")
+                continue
+            print(f"{name}: {median * 1000:.0f} ms median of {args.runs}")
+
+            heavy = [line[len('HEAVY:'):] for line in result.stderr.splitlines() if line.startswith('HEAVY:')]
+            if heavy and heavy[0]:
+                print(f"  report imported {heavy[0]}")
+                failed = True
+
+        # The caches create their directory / database when they are opened
+        opened = [path for path in (keepa_cache_dir, os.path.dirname(verdict_cache_path)) if os.path.exists(path)]
+        if opened:
+            print(f"  a subcommand opened the caches at startup: {opened}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# The bench_queries.py checks as a pytest module: every hot query has to use the index it was
+# designed around and fit its budget on the seeded synthetic catalog.
+#
+#   BENCH_DATABASE_URL=postgresql://oa:oa@localhost:5432/oa_bench python -m pytest benchmarks/test_queries.py
+#
+# Skipped without BENCH_DATABASE_URL. The module seeds that database first, which drops and
+# recreates every table, so never point it at a database holding real data.
+import os
+
+import pytest
+
+from bench_queries import explain, hot_queries, seed
+
+DATABASE_URL = os.getenv('BENCH_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="set BENCH_DATABASE_URL to a scratch Postgres database")
+
+
+@pytest.fixture(scope='module')
+def session():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    engine = create_engine(DATABASE_URL)
+    seed(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.mark.parametrize('name, sql, index, budget_ms', hot_queries(), ids=[query[0] for query in hot_queries()])
+def test_hot_query_uses_its_index(session, name, sql, index, budget_ms):
+    best, indexes = explain(session, sql)
+    assert index in indexes, f"{name}: plan uses {sorted(indexes) or 'no index'}, expected {index}"
+    assert best <= budget_ms * float(os.getenv('BENCH_BUDGET_SCALE', 1)), f"{name}: {best:.1f} ms over the {budget_ms} ms budget"
@@ -1,112 +1,130 @@
-from bs4 import BeautifulSoup
-import openai
-import asyncio
-import json
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-import time
-import re
-import os
-from sqlalchemy.orm import joinedload
-from urllib.parse import unquote, urlparse, parse_qs
-import urllib.parse
-import numpy as np
-from datetime import datetime, timedelta
-import pandas as pd
-from sqlalchemy import or_, and_, desc
-
-
-from app.models import Product, AmazonProduct, ProductMatch
-from app.db import SessionLocal
-import keepa
+import argparse
+import atexit
+import functools
 import logging
+import os
+import sys
+import threading
+
+# Only light modules at the top: selenium, openai, keepa, numpy and SQLAlchemy are imported
+# by the functions and subcommands that use them, so `report` does not pay for the browser stack
+from app.keepa_client import KEEPA_MAX_BATCH
+from app.verdict_cache import verdict_key
+from app.pipeline import PartialBatchFailure, Pipeline, Stage
+from app.parallel import scrape_pages
 
 # Set up logger
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 
 
-# Function to fetch historical data from Keepa API, including offer data
-def fetch_historical_data(asin):
-    try:
-        domain_code = 'US'  # Correct domain code for Amazon US
-        stats_days = 90  # Use 90 days of statistics
-        offers = 20  # Fetch up to 20 offers
-        days = 365  # Fetch 365 days of history
-
-        # Fetch data with the history and days parameters
-        logger.debug(f"Fetching data from Keepa for ASIN: {asin}")
-        product_data = keepa_api.query(asin, domain=domain_code, stats=stats_days, offers=offers, buybox=True, history=1, days=days)
-        
-        logger.debug(f"Data fetched for ASIN: {asin}")
-        return product_data[0] if product_data else None
-    except Exception as e:
-        logger.error(f"Error fetching data from Keepa: {e}")
-        return None
+# Optional caches, each opened on first use by the subcommand that needs it
+keepa_cache = None
+amazon_search_cache = None
+match_verdict_cache = None
+caches_lock = threading.Lock()
 
 
-# Convert keepa time to unix time
-def keepaTimeMinutesToUnixTime(keepaMinutes):
-    return (21564000 + int(keepaMinutes)) * 60000
+# Optional on-disk cache of Keepa payloads, enabled by setting KEEPA_CACHE_DIR
+def get_keepa_cache():
+    global keepa_cache
+    with caches_lock:
+        if keepa_cache is None and os.getenv('KEEPA_CACHE_DIR'):
+            from app.keepa_cache import KeepaCache
+            keepa_cache = KeepaCache(os.getenv('KEEPA_CACHE_DIR'), ttl_seconds=int(os.getenv('KEEPA_CACHE_TTL', 24 * 3600)))
+    return keepa_cache
 
-# Transform prices data to list
-def transformKeepaHistoryList(buy_box_seller_history):
-    return [(datetime.utcfromtimestamp(keepaTimeMinutesToUnixTime(keepaMinutes) / 1000), val) for
-                      keepaMinutes, val in zip(buy_box_seller_history[::2], buy_box_seller_history[1::2])]
 
-def fill_missing_days(df, last_n_days=90):
-    # Create a full date range from today back to last_n_days (ignoring time)
-    end_date = pd.Timestamp(datetime.utcnow().date())  # Convert to pandas Timestamp and remove time
-    start_date = end_date - timedelta(days=last_n_days)
-    all_dates = pd.date_range(start=start_date, end=end_date)
+# Optional cache of Amazon search results keyed by normalized title, enabled by setting AMAZON_SEARCH_CACHE_PATH
+def get_amazon_search_cache():
+    global amazon_search_cache
+    with caches_lock:
+        if amazon_search_cache is None and os.getenv('AMAZON_SEARCH_CACHE_PATH'):
+            from app.search_cache import SearchResultCache
+            amazon_search_cache = SearchResultCache(os.getenv('AMAZON_SEARCH_CACHE_PATH'), ttl_seconds=int(os.getenv('AMAZON_SEARCH_CACHE_TTL', 7 * 24 * 3600)))
+            # Writes are batched, save the last ones on exit
+            atexit.register(amazon_search_cache.close)
+    return amazon_search_cache
 
-    # Normalize the 'date' column to truncate to just the date (ignoring hours and minutes)
-    df['date'] = df['date'].dt.normalize()
 
-    # Drop duplicates to ensure one entry per day
-    df = df.drop_duplicates(subset='date', keep='last')
+# Optional cache of per-image match verdicts, enabled by setting MATCH_VERDICT_CACHE_PATH
+def get_match_verdict_cache():
+    global match_verdict_cache
+    with caches_lock:
+        if match_verdict_cache is None and os.getenv('MATCH_VERDICT_CACHE_PATH'):
+            from app.verdict_cache import VerdictCache
+            match_verdict_cache = VerdictCache(os.getenv('MATCH_VERDICT_CACHE_PATH'))
+    return match_verdict_cache
 
-    # Set the date as index for the history dataframe
-    df.set_index('date', inplace=True)
 
-    # Reindex to ensure every day is represented, fill missing seller with the previous value
-    df = df.reindex(all_dates, method='ffill').reset_index()
-    
-    # Rename columns
-    df.columns = ['date', 'seller']
-    
-    return df
+keepa_api = None
+keepa_api_lock = threading.Lock()
+
 
+# Keepa API client from the KEEPA_API key, created on first use
+def get_keepa_api():
+    global keepa_api
+    with keepa_api_lock:
+        if keepa_api is None:
+            keepa_api_key = os.getenv('KEEPA_API')
+            if not keepa_api_key:
+                logger.error("Keepa API key not found in environment variables. Set the 'KEEPA_API' environment variable.")
+                raise ValueError("Keepa API key not found in environment variables. Set the 'KEEPA_API' environment variable.")
+
+            import keepa
+            logger.debug("Initializing Keepa API with the provided key.")
+            keepa_api = keepa.Keepa(keepa_api_key)
+    return keepa_api
+
+
+# Function to fetch historical data from Keepa API, including offer data
+def fetch_historical_data(asin):
+    try:
+        return fetch_historical_data_batch([asin]).get(asin)
+    except Exception:
+        return None
+
+
+# Function to fetch historical data for many ASINs at once, returns a dict of asin -> product data (None for
+# rejected ASINs). Raises when Keepa is unavailable, so run_enrichment leaves the batch for the next run
+# instead of storing -1 for every ASIN.
+def fetch_historical_data_batch(asins, batch_size=KEEPA_MAX_BATCH):
+    from app.keepa_cache import fetch_products_cached
+    from app.keepa_client import fetch_products
+
+    try:
+        cache = get_keepa_cache()
+        if cache:
+            return fetch_products_cached(get_keepa_api(), cache, asins, batch_size=batch_size)
+        return fetch_products(get_keepa_api(), asins, batch_size=batch_size)
+    except Exception as e:
+        logger.error(f"Error fetching data from Keepa: {e}")
+        raise
 
 
 def get_amazon_buy_box_count(buy_box_seller_history):
+    from app.buybox import count_buy_box_days
+
     logger.debug("Checking if Amazon held the buy box at least once in the last 90 days...")
 
     if not buy_box_seller_history:
         logger.debug("No buy box seller history available.")
         return -1
 
-    # Transform history list into a dataframe
-    buyboxhistory = transformKeepaHistoryList(buy_box_seller_history)
-    df_buyboxhistory = pd.DataFrame(buyboxhistory, columns=['date', 'seller'])
-    # print(df_buyboxhistory.to_string())
-
-    # Fill in missing days and limit to the last 90 days
-    df_filled = fill_missing_days(df_buyboxhistory)
-
-    # Count how many days Amazon (ATVPDKIKX0DER) held the buy box
-    amazon_seller_id = 'ATVPDKIKX0DER'
-    amazon_buy_box_days = df_filled['seller'].value_counts().get(amazon_seller_id, 0)
+    # Count how many days Amazon (ATVPDKIKX0DER) held the buy box, forward filling missing days
+    amazon_buy_box_days = int(count_buy_box_days([buy_box_seller_history], last_n_days=90)[0])
 
     logger.debug(f"Amazon held the buy box for {amazon_buy_box_days} days in the last 90 days.")
     
     return amazon_buy_box_days
+
+# Batch version of get_amazon_buy_box_count, returns a dict of asin -> Amazon buy box days
+def get_amazon_buy_box_counts(buy_box_histories_by_asin):
+    from app.buybox import count_buy_box_days
+
+    asins = list(buy_box_histories_by_asin)
+    counts = count_buy_box_days([buy_box_histories_by_asin[asin] for asin in asins], last_n_days=90)
+    return {asin: int(count) for asin, count in zip(asins, counts)}
     
 # Analyze product based on rules
 def analyze_product(asin):
@@ -114,6 +132,10 @@ def analyze_product(asin):
 
     # Fetch Keepa data
     historical_data = fetch_historical_data(asin)
+    return analyze_product_data(historical_data)
+
+# Analyze already fetched Keepa product data
+def analyze_product_data(historical_data):
     if not historical_data:
         logger.error("Failed to fetch historical data from Keepa.")
         return -1, -1
@@ -129,82 +151,84 @@ def analyze_product(asin):
 
     return amazon_buy_box_count, current_sellers
 
-# Function to query all records, analyze each product, and update the fields
-def analyze_and_update_products(session):
-    # Query all products where amazon_buy_box_count is NULL (i.e., unprocessed)
-    products = session.query(AmazonProduct).filter(or_(AmazonProduct.amazon_buy_box_count.is_(None), AmazonProduct.amazon_buy_box_count == -1)).all()
-
-    for product in products:
-        asin = product.asin
-        logger.debug(f"Processing product with ASIN: {asin}")
-
-        # Call the analyze_product function
-        amazon_buy_box_count, current_sellers = analyze_product(asin)
-
-        # Convert numpy.int64 to native Python int
-        if isinstance(amazon_buy_box_count, np.integer):
-            amazon_buy_box_count = int(amazon_buy_box_count)
-
-        if isinstance(current_sellers, np.integer):
-            current_sellers = int(current_sellers)
-
-        print(f"Amazon buy box count: {amazon_buy_box_count}, Current sellers: {current_sellers}")
-        
-        # Check if the analysis was successful
-        if amazon_buy_box_count is not None and current_sellers is not None:
-            # Update the amazon_buy_box_count and current_sellers fields
-            product.amazon_buy_box_count = amazon_buy_box_count
-            product.current_sellers = current_sellers
-            # Commit the changes to the database
-            session.commit()
-            logger.debug(f"Updated product {asin} with buy box count {amazon_buy_box_count} and current sellers {current_sellers}")
-        else:
-            logger.error(f"Failed to update product {asin} due to missing data.")
+# Analyze the Keepa data of a whole batch, returns a dict of asin -> (amazon_buy_box_count, current_sellers).
+# The buy box days of every ASIN come from one vectorized count instead of one count per ASIN.
+def analyze_products_data(data_by_asin):
+    buy_box_counts = get_amazon_buy_box_counts({
+        asin: historical_data.get('buyBoxSellerIdHistory', []) for asin, historical_data in data_by_asin.items() if historical_data
+    })
+
+    results = {}
+    for asin, historical_data in data_by_asin.items():
+        if not historical_data:
+            logger.error(f"Failed to fetch historical data from Keepa for {asin}.")
+            results[asin] = (-1, -1)
+            continue
+        seller_count_history = historical_data['data'].get('COUNT_NEW', [])[-90:]  # New offer count history for the last 90 days
+        current_sellers = seller_count_history[-1] if len(seller_count_history) > 0 else 0
+        results[asin] = (buy_box_counts[asin], current_sellers)
+    return results
+
+# Function to query all unprocessed records, analyze them concurrently, and bulk update the fields
+def analyze_and_update_products(session, workers=4, batch_size=KEEPA_MAX_BATCH, page_size=1000):
+    from app.enrichment import run_enrichment
+
+    # Products where amazon_buy_box_count is NULL (i.e., unprocessed) or -1 are streamed in pages,
+    # fetched and analyzed by a pool of workers and written back with one UPDATE per batch
+    stats = run_enrichment(session, fetch_historical_data_batch, analyze_products_data, workers=workers, batch_size=batch_size, page_size=page_size)
+
+    if keepa_cache:
+        logger.info(f"Keepa cache: {keepa_cache.stats()}")
 
     logger.info("All products have been analyzed and updated.")
+    return stats
 
 
 
-def extract_asin(url):
-    # Try to extract ASIN directly from the path
-    match = re.search(r'/([A-Z0-9]{10})(?:[/?]|$)', url)
-    if match:
-        return match.group(1)
-
-    # If no match, check if ASIN is inside query parameters
-    parsed_url = urlparse(url)
-    query_params = parse_qs(parsed_url.query)
-    if 'url' in query_params:
-        decoded_url = unquote(query_params['url'][0])
-        match = re.search(r'/([A-Z0-9]{10})(?:[/?]|$)', decoded_url)
-        if match:
-            return match.group(1)
-
-    return None
 
 # Function to search for the product on Amazon and return an array with URLs, titles, and image URLs for the first 10 results
 def search_amazon_with_selenium(product):
     title = product.get('title')
 
-    chrome_options = Options()
-    chrome_options.debugger_address = "localhost:9222"  # Connect to running Chrome session
-    chrome_options.headless = False  # To see browser actions
+    # Serve repeated titles from the local cache without touching the browser
+    search_cache = get_amazon_search_cache()
+    if search_cache:
+        return search_cache.get_or_search(title, search_amazon_in_pooled_tab)
+    return search_amazon_in_pooled_tab(title)
+
+# Borrow a long-lived Amazon tab from the pool, every page has the search bar
+def search_amazon_in_pooled_tab(title):
+    from app.browser import get_amazon_tab_pool
 
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.execute_script("window.open('https://www.amazon.com', '_blank');")
-    driver.switch_to.window(driver.window_handles[-1])
+    with get_amazon_tab_pool().tab() as driver:
+        return search_amazon_in_tab(driver, title)
 
-    time.sleep(5)
+# Run one Amazon search in an already open tab
+def search_amazon_in_tab(driver, title):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.support import expected_conditions as EC
+    from app.readiness import elements_populated, network_idle, wait_for_navigation, wait_until
 
     try:
-        wait = WebDriverWait(driver, 30)
-        search_bar = wait.until(EC.presence_of_element_located((By.ID, 'twotabsearchtextbox')))
-        search_bar = wait.until(EC.element_to_be_clickable((By.ID, 'twotabsearchtextbox')))
+        search_bar = wait_until(driver, 'amazon', 'search_box', EC.element_to_be_clickable((By.ID, 'twotabsearchtextbox')))
         search_bar.clear()
         search_bar.send_keys(title)
+
+        # Remember the current page, every page has an <html> element (the home page of a fresh pooled
+        # tab has no results grid); the results page must replace it before idleness means anything
+        previous_page = driver.find_element(By.TAG_NAME, 'html')
+        previous_url = driver.current_url
         search_bar.send_keys(Keys.RETURN)
+        if not wait_for_navigation(driver, 'amazon', previous_page, old_url=previous_url):
+            logger.warning(f"Amazon search for {title!r} never left the previous page")
+            return []
 
-        time.sleep(5)
+        # Ready once the result grid has products, or the page went quiet (no results)
+        wait_until(driver, 'amazon', 'search_results', EC.any_of(
+            elements_populated((By.CSS_SELECTOR, '.s-main-slot .s-result-item[data-asin]:not([data-asin=""])')),
+            network_idle(1.0),
+        ))
 
         results = driver.find_elements(By.CSS_SELECTOR, '.s-main-slot .s-result-item')[:10]
         amazon_results = []
@@ -240,362 +264,85 @@ def search_amazon_with_selenium(product):
     except Exception as e:
         print(f"Error occurred while searching Amazon: {e}")
         return []
-    finally:
-        driver.close()
-
-# Function to scrape Walgreens promotions using Selenium
-def scrape_walgreens_promotions_selenium(target_url):
-    # Initialize Selenium WebDriver with the existing Chrome session
-    chrome_options = Options()
-    chrome_options.debugger_address = "localhost:9222"  # Connect to running Chrome session
-    chrome_options.headless = False  # To see browser actions
-
-    driver = webdriver.Chrome(options=chrome_options)
-
-    # Open a new tab with Walgreens URL
-    driver.execute_script(f"window.open('{target_url}', '_blank');")
-    driver.switch_to.window(driver.window_handles[-1])
-    print(f"Opened new Walgreens tab: {driver.current_url}")
-
-    # Wait for the product container to load
-    try:
-        wait = WebDriverWait(driver, 30)  # Wait for up to 30 seconds
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'ul.product-container')))
-        
-        # Get the page content after the JavaScript has loaded
-        content = driver.page_source
-        soup = BeautifulSoup(content, 'html.parser')
-
-        # Locate the product list container
-        products_list = soup.find('ul', class_='product-container')
-
-        # Check if products_list is found
-        if not products_list:
-            print("No products found on the page.")
-            return []
 
-        products = products_list.find_all('li', class_='item owned-brands')
-        walgreens_products = []
+# Known products unchanged on the listing tile skip their detail page, set INCREMENTAL_CRAWL=0 to always open it
+incremental_crawl = os.getenv('INCREMENTAL_CRAWL', '1') != '0'
 
-        print(f"Found {len(products)} products on the page.")
+# Scrape one listing page of a retailer ('walgreens', 'cvs' or 'samsclub'), all of them run on the
+# same adapter-driven engine in app/retailers.py
+def scrape_retailer_page(retailer, target_url, claims=None, known_products=None):
+    from app.retailers import ADAPTERS, scrape_listing_page
 
-        for product in products:
-            try:
-                # Extract the product URL to navigate to the product details page
-                product_url = 'https://www.walgreens.com' + product.find('a', href=True)['href']
-
-                # Check if product URL is already in the database
-                session = SessionLocal()
-                existing_product = session.query(Product).filter_by(product_url=product_url).first()
-                session.close()
-
-                # Retry logic for loading the product details page
-                retries = 3
-                while retries > 0:
-                    try:
-                        # Open the product details page
-                        driver.get(product_url)
-                        wait = WebDriverWait(driver, 15)  # Set a 15-second timeout
-                        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'ul#thumbnailImages')))  # Wait for thumbnail images to load
-                        break  # Exit the retry loop if successful
-                    except Exception as e:
-                        retries -= 1
-                        print(f"Timeout reached for {product_url}. Retrying... {3 - retries} attempt(s) left.")
-                        if retries > 0:
-                            driver.refresh()  # Refresh the page and retry
-                        else:
-                            print(f"Failed to load product details page after 3 attempts. Skipping {product_url}.")
-                            continue  # Skip to the next product if retries are exhausted
-
-                # Get the page content for the product details page
-                product_content = driver.page_source
-                product_soup = BeautifulSoup(product_content, 'html.parser')
-
-                # Extract the full product name including the brand, title, and size from the h1 tag with id="productName"
-                product_name_h1 = product_soup.find('h1', id='productName')
-                title = " ".join(product_name_h1.stripped_strings) if product_name_h1 else "No title found"
-
-                # Extract prices (regular price and sale price) and clean the result
-                regular_price_div = product_soup.find('div', id='regular-price-wag-hn-lt-bold')
-                regular_price = regular_price_div.text.strip().replace('old price', '').strip() if regular_price_div else "No regular price"
-
-                sales_price_div = product_soup.find('span', id='sales-price')
-                sales_price = sales_price_div.text.strip().replace('Sale price', '').strip() if sales_price_div else "No sales price"
-
-                if existing_product:
-                    if existing_product.last_seen_price == sales_price:
-                        print(f"Product with URL {product_url} already exists and the price is the same seting as in stock.")
-                        existing_product.in_stock = True
-                        session = SessionLocal()
-                        session.add(existing_product)
-                        session.commit()
-                        session.close()
-                        continue
-                    print(f"Product with URL {product_url} already exists, updating the price.")
-                    existing_product.last_seen_price = sales_price
-                    existing_product.in_stock = True
-                    session = SessionLocal()
-                    session.add(existing_product)
-                    session.commit()
-                    session.close()
-                    continue
-
-                # Extract the image from the div you mentioned
-                image_urls = []
-                image_div = product_soup.find('div', style=lambda s: 'background-image' in s if s else False)
-                if image_div:
-                    # Extract background image URL from style attribute
-                    style = image_div['style']
-                    image_url = style.split('url(')[-1].split(')')[0].replace('"', '').replace("'", "")
-                    if image_url.startswith("//"):
-                        image_url = f"https:{image_url}"
-                    image_urls.append(image_url)
-
-                # Also extract images from the thumbnail carousel as a fallback
-                thumbnails = product_soup.find('ul', id='thumbnailImages')
-                if thumbnails:
-                    # Loop through each <li> element that contains the <img> and extract the image URLs
-                    for li in thumbnails.find_all('li'):
-                        img_tag = li.find('img')
-                        if img_tag and img_tag.get('src'):
-                            # Add https: to the image URL as it seems to be incomplete
-                            image_url = f"https:{img_tag['src']}"
-                            image_urls.append(image_url)
-
-                walgreens_product={
-                    'title': title,
-                    'price': sales_price,
-                    'image_urls': image_urls,
-                    'product_url': product_url,
-                    'source': 'walgreens'
-                }
-
-                print(f"Product: {title}\nPrice: {sales_price}\nProduct URL: {product_url}")
-
-                walgreens_products.append(walgreens_product)
-
-                # Perform Amazon search and return the first 10 results
-                amazon_results = search_amazon_with_selenium(walgreens_product)
-                matching_indexes = find_matching_amazon_images(walgreens_product, amazon_results)
-                matching_amazon = []
-
-                for matching_index in matching_indexes:
-                    try:
-                        # print(f"Matching Amazon url: {amazon_results[matching_index-1]['url']}")
-                        matching_amazon.append(amazon_results[matching_index-1])
-                        print(f"Amazon URL: {amazon_results[matching_index-1]['url']}")
-                    except IndexError:
-                        print(f"Index {matching_index} is out of range.")
-                        pass
-
-                insert_data_to_db(walgreens_product, matching_amazon)
-                print(f"Inserted product: {title}")
-                print (10*'-')
-                time.sleep(3)
-            except Exception as e:
-                print(f"Error occurred while processing a product: {e}")
-                continue
-
-        return walgreens_products
+    return scrape_listing_page(
+        ADAPTERS[retailer], target_url, build_product_pipeline, claims,
+        incremental=incremental_crawl, known_products=known_products,
+    )
 
-    except Exception as e:
-        print(f"Error occurred while scraping Walgreens: {e}")
-        pass
-    finally:
-        # Close only the current tab
-        driver.close()
+def scrape_walgreens_promotions_selenium(target_url, claims=None):
+    return scrape_retailer_page('walgreens', target_url, claims)
 
+def scrape_cvs_promotions_selenium(target_url, claims=None):
+    return scrape_retailer_page('cvs', target_url, claims)
 
-# Function to scrape CVS promotions from the product list without opening each product
-def scrape_cvs_promotions_selenium(target_url):
-    # Selectively encode the problematic parts of the URL
-    encoded_url = target_url.replace("'", "%27")
+def scrape_samsclub_promotions_selenium(target_url, claims=None):
+    return scrape_retailer_page('samsclub', target_url, claims)
 
-    # Initialize Selenium WebDriver with the existing Chrome session
-    chrome_options = Options()
-    chrome_options.debugger_address = "localhost:9222"  # Connect to running Chrome session
-    chrome_options.headless = False  # To see browser actions
 
-    driver = webdriver.Chrome(options=chrome_options)
+# Function to insert the product and match data into the database
+def insert_data_to_db(product_data, amazon_data):
+    return bulk_insert_data_to_db([(product_data, amazon_data)])
 
-    # Open a new tab with the encoded CVS URL
-    driver.execute_script(f"window.open('{encoded_url}', '_blank');")
-    driver.switch_to.window(driver.window_handles[-1])
-    print(f"Opened new CVS tab: {driver.current_url}")
+# Function to upsert many (product, matching Amazon results) pairs in one transaction, returns the resolved
+# ids in the order of items, None for an item that could not be stored. When the batch transaction fails
+# the items are retried one by one, so one bad row does not lose the others.
+def bulk_insert_data_to_db(items):
+    from app.db import SessionLocal
+    from app.ingest import bulk_upsert_products
 
-    # Wait for the product container to load
+    items = list(items)
+    session = SessionLocal()
     try:
-        wait = WebDriverWait(driver, 30)  # Wait for up to 30 seconds
-        # CSS selector for the product container
-        product_list_selector = (
-            "#root > div > div > div > div.css-1dbjc4n.r-13awgt0.r-1mlwlqe.r-1wgg2b2.r-13qz1uu > div > div:nth-child(1) > div > div > div > main > div > div > div.css-1dbjc4n.r-n2h5ot.r-bnwqim.r-13qz1uu > div > div > div > div.css-1dbjc4n.r-13awgt0.r-1mlwlqe > div > div > div"
-        )
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, product_list_selector)))
-
-        # Get the page content after the JavaScript has loaded
-        content = driver.page_source
-        soup = BeautifulSoup(content, 'html.parser')
-
-        # Locate the product list container
-        products_list = soup.select_one(product_list_selector)
-
-        # Check if products_list is found
-        if not products_list:
-            print("No products found on the page.")
-            return []
-
-        # Locate all the product elements using the specific class you provided
-        products = products_list.find_all('div', class_='css-1dbjc4n r-18u37iz r-tzz3ar')
-        cvs_products = []
-
-        print(f"Found {len(products)} products on the page.")
-
-        for product in products:
+        try:
+            return bulk_upsert_products(session, items)
+        except Exception as e:
+            session.rollback()
+            if len(items) == 1:
+                print(f"Error inserting data into database: {e}")
+                return [None]
+            print(f"Error inserting {len(items)} products into database, retrying one by one: {e}")
+
+        results = []
+        for item in items:
             try:
-                # Extract product title from the section you specified
-                title_div = product.find('div', class_='css-901oao css-cens5h r-b0vftf r-1xaesmv r-ubezar r-majxgm r-29m4ib r-rjixqe r-1bymd8e r-fdjqy7 r-13qz1uu')
-                title = title_div.text.strip() if title_div else "No title found"
-
-                # Extract product image URL
-                img_tag = product.find('img', class_='PLP-tile-image')
-                image_url = img_tag['src'] if img_tag else ''
-                if image_url.startswith("//"):
-                    image_url = f"https:{image_url}"
-
-                # Extract product price from the <div> containing the price
-                price_div = product.find('div', class_='css-901oao', attrs={'aria-label': lambda x: x and 'Price' in x})
-                price = price_div.text.strip() if price_div else "No price found"
-
-                # Extract the product URL from the <a> tag
-                product_link_tag = product.find('a', href=True)
-                product_url = 'https://www.cvs.com' + product_link_tag['href'] if product_link_tag else "No URL found"
-
-                # Check if product URL is already in the database
-                session = SessionLocal()
-                existing_product = session.query(Product).filter_by(product_url=product_url).first()
-                session.close()        
-
-                if existing_product:
-                    if existing_product.last_seen_price == price:
-                        print(f"Product with URL {product_url} already exists and the price is the same seting as in stock.")
-                        existing_product.in_stock = True
-                        session = SessionLocal()
-                        session.add(existing_product)
-                        session.commit()
-                        session.close()
-                        continue
-                    print(f"Product with URL {product_url} already exists, updating the price.")
-                    existing_product.last_seen_price = price
-                    existing_product.in_stock = True
-                    session = SessionLocal()
-                    session.add(existing_product)
-                    session.commit()
-                    session.close()
-                    continue
-
-
-                cvs_product = {
-                    'title': title,
-                    'price': price,
-                    'image_urls': [image_url],
-                    'product_url': product_url,
-                    'source': 'cvs'
-                }
-
-                print(f"Product: {title}\nPrice: {price}\nImage URL: {image_url}\nProduct URL: {product_url}")
-                cvs_products.append(cvs_product)
-
-                # Perform Amazon search and return the first 10 results
-                amazon_results = search_amazon_with_selenium(cvs_product)
-                matching_indexes = find_matching_amazon_images(cvs_product, amazon_results)
-                matching_amazon = []
-
-                for matching_index in matching_indexes:
-                    try:
-                        # print(f"Matching Amazon url: {amazon_results[matching_index-1]['url']}")
-                        matching_amazon.append(amazon_results[matching_index-1])
-                        print(f"Amazon URL: {amazon_results[matching_index-1]['url']}")
-                    except IndexError:
-                        print(f"Index {matching_index} is out of range.")
-                        pass
-
-                insert_data_to_db(cvs_product, matching_amazon)
-                print (10*'-')
-
+                results.extend(bulk_upsert_products(session, [item]))
             except Exception as e:
-                print(f"Error occurred while processing a product: {e}")
-                continue
+                session.rollback()
+                print(f"Error inserting data into database for {item[0].get('product_url')}: {e}")
+                results.append(None)
+        return results
+    finally:
+        session.close()
 
-        time.sleep(5)
-        return cvs_products
+# Concurrent LLM requests, also the number of match workers in the product pipeline
+match_concurrency = int(os.getenv('MATCH_CONCURRENCY', 4))
+matching_service = None
+matching_service_lock = threading.Lock()
 
-    except Exception as e:
-        print(f"Error occurred while scraping CVS: {e}")
-        pass
-    finally:
-        # Close only the current tab
-        driver.close()
+# Parallel Amazon searches, one per pooled tab
+amazon_search_workers = int(os.getenv('AMAZON_TAB_POOL_SIZE', 2))
 
+# Listing pages scraped at once, each in its own tab; keep it under the retailer's rate limit
+scrape_workers = int(os.getenv('SCRAPE_WORKERS', 2))
 
+# Amazon results are ranked by title similarity before any image work: results scoring below
+# TITLE_MATCH_MIN_SCORE describe another product (0 keeps them all), and at most TITLE_MATCH_KEEP
+# of the best ones go on to the image prefilter and the LLM (0 keeps them all)
+title_match_min_score = float(os.getenv('TITLE_MATCH_MIN_SCORE', 0.1))
+title_match_keep = int(os.getenv('TITLE_MATCH_KEEP', 0))
 
-# Function to insert the product and match data into the database
-def insert_data_to_db(product_data, amazon_data):
-    session = SessionLocal()
-    try:
-        # Check if the Walgreens product already exists by URL
-        existing_product = session.query(Product).filter_by(product_url=product_data['product_url']).first()
-
-        if existing_product:
-            product_id = existing_product.id
-        else:
-            # Insert Walgreens Product if it doesn't exist
-            product = Product(
-                title=product_data['title'],
-                image_urls=product_data['image_urls'],
-                product_url=product_data['product_url'],
-                source=product_data['source'],
-                last_seen_price=product_data['price'],
-                in_stock=True
-            )
-            session.add(product)
-            session.commit()
-            product_id = product.id
-
-        # Insert Amazon products and matches
-        for amazon in amazon_data:
-            asin = extract_asin(amazon['url'])  # Extract the ASIN from the Amazon URL
-            
-            # Check if the Amazon product with this ASIN already exists
-            existing_amazon_product = session.query(AmazonProduct).filter_by(asin=asin).first()
-
-            if existing_amazon_product:
-                amazon_product_id = existing_amazon_product.id
-            else:
-                # Insert Amazon product if it doesn't exist
-                amazon_product = AmazonProduct(
-                    asin=asin,
-                    title=amazon['title'],
-                    product_url=amazon['url'],
-                    image_url=amazon['image_url']
-                )
-                session.add(amazon_product)
-                session.commit()
-                amazon_product_id = amazon_product.id
-
-            # Check if the match between product and Amazon product already exists
-            existing_match = session.query(ProductMatch).filter_by(product_id=product_id, amazon_product_id=amazon_product_id).first()
-
-            if not existing_match:
-                # Create and insert the match if it doesn't exist
-                product_match = ProductMatch(product_id=product_id, amazon_product_id=amazon_product_id)
-                session.add(product_match)
-                session.commit()
+# Local perceptual hash prefilter ahead of the LLM, enabled by setting IMAGE_PREFILTER=1
+image_prefilter_enabled = os.getenv('IMAGE_PREFILTER') == '1'
 
-    except Exception as e:
-        session.rollback()
-        print(f"Error inserting data into database: {e}")
-    finally:
-        session.close()
 
 # Function to find matching Amazon product images using OpenAI API
 def find_matching_amazon_images(product, amazon_results):
@@ -608,306 +355,336 @@ def find_matching_amazon_images(product, amazon_results):
 
     first_image_url = image_urls[0]  # Take the first image URL
 
-    # Extract Amazon image URLs from the amazon_results
-    amazon_image_urls = [result['image_url'] for result in amazon_results if 'image_url' in result]
+    # Amazon images with their 1-based position in amazon_results
+    candidates = [(index, result['image_url']) for index, result in enumerate(amazon_results, start=1) if 'image_url' in result]
+
+    # Drop candidates whose title clearly describes another product before any image work, best first.
+    # Without a retailer title there is nothing to compare against.
+    if title and candidates:
+        from app.title_match import rank_candidates
+        ranked = rank_candidates(
+            title, [amazon_results[index - 1] for index, _ in candidates],
+            min_score=title_match_min_score, keep=title_match_keep or None,
+        )
+        logger.debug(f"Title match kept {len(ranked)} of {len(candidates)} Amazon candidates")
+        candidates = [candidates[position - 1] for position, _ in ranked]
+        if not candidates:
+            return []
 
-    # Construct the prompt
-    prompt = f"In the first image i have a product, check if the produt is present in any othe other images make sure is the same product with teh same colors and details. return just an array and nothing else with the list of integer indexes of images that match the first image."
+    # Settle clear matches and clear misses locally, only the ambiguous middle band goes to the LLM
+    accepted = []
+    if image_prefilter_enabled and candidates:
+        from app.image_prefilter import prefilter_candidates, prefilter_thresholds
+        reject_below, accept_above = prefilter_thresholds()
+        accepted_positions, ambiguous_positions, rejected_positions, _ = prefilter_candidates(
+            first_image_url, [image_url for _, image_url in candidates], reject_below=reject_below, accept_above=accept_above
+        )
+        logger.debug(f"Image prefilter: {len(accepted_positions)} accepted, {len(ambiguous_positions)} ambiguous, {len(rejected_positions)} rejected")
+        accepted = [candidates[position][0] for position in accepted_positions]
+        candidates = [candidates[position] for position in ambiguous_positions]
+        if not candidates:
+            return accepted
+
+    return sorted(accepted + match_candidates_with_llm(first_image_url, candidates))
+
+# The 1-based positions of the model's answer that point into a list of `count` images, anything else
+# it made up (out of range, not an integer) is dropped before it is used or cached
+def _valid_positions(matching_indexes, count):
+    return {
+        position for position in matching_indexes or []
+        if isinstance(position, int) and not isinstance(position, bool) and 0 < position <= count
+    }
+
+# Ask the LLM (or the verdict cache) which (index, image_url) candidates match the retailer image
+def match_candidates_with_llm(first_image_url, candidates):
+    # Nothing left to ask about, e.g. every candidate was settled by the title or image prefilter
+    if not candidates:
+        return []
 
+    verdict_cache = get_match_verdict_cache()
+    if not verdict_cache:
+        # The model answers with positions in the list it was sent
+        matching_indexes = ask_matching_image_indexes(first_image_url, [image_url for _, image_url in candidates])
+        matched_positions = _valid_positions(matching_indexes, len(candidates))
+        return [index for position, (index, _) in enumerate(candidates, start=1) if position in matched_positions]
+
+    # Reuse verdicts already given for the same (retailer image, Amazon image, prompt)
+    from app.matching_service import MATCH_PROMPT_VERSION
+    # Candidates without an image get no key and always go to the model
+    keys = {index: verdict_key(first_image_url, image_url, MATCH_PROMPT_VERSION) for index, image_url in candidates}
+    cached = verdict_cache.get_many(key for key in keys.values() if key is not None)
+    uncached = [(index, image_url) for index, image_url in candidates if keys[index] is None or keys[index] not in cached]
+    verdicts = {index: cached[keys[index]] for index, _ in candidates if keys[index] in cached}
+
+    if uncached:
+        # Only the uncached images go to the model, its indexes refer to that shorter list
+        matching_indexes = ask_matching_image_indexes(first_image_url, [image_url for _, image_url in uncached])
+        if matching_indexes is None:
+            return [index for index, _ in candidates if verdicts.get(index)]
+
+        matched_positions = _valid_positions(matching_indexes, len(uncached))
+        new_verdicts = {index: position in matched_positions for position, (index, _) in enumerate(uncached, start=1)}
+        verdict_cache.put_many({keys[index]: verdict for index, verdict in new_verdicts.items() if keys[index] is not None})
+        verdicts.update(new_verdicts)
+    else:
+        logger.debug(f"All {len(candidates)} image verdicts cached, skipping the LLM call")
+
+    return [index for index, _ in candidates if verdicts.get(index)]
+
+# Ask the model which of the Amazon images show the same product as the first image.
+# Returns 1-based indexes into amazon_image_urls, or None when the answer could not be parsed.
+def ask_matching_image_indexes(first_image_url, amazon_image_urls):
+    # Goes through the shared async service: bounded concurrency, retries on 429/5xx, latency stats
+    return get_matching_service().submit(first_image_url, amazon_image_urls).result()
+
+# Amazon results the LLM matched to the retailer product
+def select_matching_amazon(product, amazon_results):
+    matching_indexes = find_matching_amazon_images(product, amazon_results)
+    matching_amazon = []
+
+    for matching_index in matching_indexes:
+        try:
+            matching_amazon.append(amazon_results[matching_index-1])
+            print(f"Amazon URL: {amazon_results[matching_index-1]['url']}")
+        except IndexError:
+            print(f"Index {matching_index} is out of range.")
+            pass
+
+    return matching_amazon
+
+# Stages after a retailer product was scraped: Amazon search -> LLM match -> bulk persist.
+# Each stage has its own workers and bounded queue, so a slow search or LLM call no longer stalls the scraper.
+def build_product_pipeline(source, known_products):
+    def search(product):
+        return product, search_amazon_with_selenium(product)
+
+    def match(item):
+        product, amazon_results = item
+        return product, select_matching_amazon(product, amazon_results)
+
+    def persist(items):
+        failed = 0
+        for (product, _), result in zip(items, bulk_insert_data_to_db(items)):
+            if result is None:
+                failed += 1
+                continue
+            known_products.add(product['product_url'], result[0], product['price'])
+            print(f"Inserted product: {product['title']}")
+        # Count the products that were searched and matched but not stored as errors
+        if failed:
+            raise PartialBatchFailure(failed)
+
+    return Pipeline(source, [
+        Stage('amazon_search', search, workers=amazon_search_workers, queue_size=50),
+        Stage('match', match, workers=match_concurrency, queue_size=50),
+        Stage('persist', persist, queue_size=100, batch_size=25),
+    ]).start()
+
+# Shared LLM matching service, created on first use
+def get_matching_service():
+    global matching_service
+    with matching_service_lock:
+        if matching_service is None:
+            from app.matching_service import MatchingService
+            matching_service = MatchingService(concurrency=match_concurrency)
+            atexit.register(matching_service.close)
+    return matching_service
+
+
+# Function to retrieve product URLs with their related Amazon product URLs, streamed from app/report.py
+def get_products_with_amazon_urls(session, **thresholds):
+    from app.report import iter_opportunities
+
+    for item in iter_opportunities(session, **thresholds):
+        yield {'product_url': item['product_url'], 'amazon_urls': [amazon['url'] for amazon in item['amazon']]}
+
+
+# Listing pages scraped by `main.py scrape <retailer>` when no URLs are given
+DEFAULT_TARGET_URLS = {
+    'walgreens': [
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true",
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=72",
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=144",
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=216",
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=288",
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=360",
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=432",
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=504",
+        "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=576",
+    ],
+    'samsclub': [
+        "https://www.samsclub.com/savings?altQuery=1585&xid=plp_popcat_Health%20&%20Beauty_6",
+    ],
+    'cvs': [
+        # "https://www.cvs.com/shop/merch/weekly-bogo-vitamins/q/Buy_1%2C_Get_1_Free/Buy_1%2C_Get_1_50%25_Off/Nature_Made/Nature's_Bounty/Nature's_Truth/Sundown_Naturals/Natures_Bounty/Natrol/Nature's_Way/Citracal/Nervive/Osteo_Bi-Flex/One_A_Day/Qunol/Natures_Way/Vicks_ZzzQuil/Airborne/Alive!/HumanN/Digestive_Advantage/Himalaya/Phillips'/Ester-C/Lisa_Frank/MiraLAX/Kappa_Books/Napz/Pure_ZZZs/Zarbee's/Vicks/Orgain/Tablets%2C_Capsules_%26_Caplets/Softgels/Chewables/Vegetarian_Tablets_%26_Capsules/Powder/Liquid/Oil/Lozenges/Dissolving_%2F_Meltaway_Tablets/prprbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrfmfmfmfmfmfmfmfmfm?widgetID=rj0r73j6&mc=cat2",
+        "https://www.cvs.com/shop/merch/weekly-bogo-vitamins/q/Buy_1%2C_Get_1_Free/Buy_1%2C_Get_1_50%25_Off/Nature_Made/Nature's_Bounty/Nature's_Truth/Sundown_Naturals/Natures_Bounty/Natrol/Nature's_Way/Citracal/Nervive/Osteo_Bi-Flex/One_A_Day/Qunol/Natures_Way/Vicks_ZzzQuil/Airborne/Alive!/HumanN/Digestive_Advantage/Himalaya/Phillips'/Ester-C/Lisa_Frank/MiraLAX/Kappa_Books/Napz/Pure_ZZZs/Zarbee's/Vicks/Orgain/Tablets%2C_Capsules_%26_Caplets/Softgels/Chewables/Vegetarian_Tablets_%26_Capsules/Powder/Liquid/Oil/Lozenges/Dissolving_%2F_Meltaway_Tablets/prprbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrfmfmfmfmfmfmfmfmfm?page=3&widgetID=rj0r73j6&mc=cat2",
+    ],
+}
 
-    # amazon_titles = [result['title'] for result in amazon_results if 'title' in result]
 
-    # prompt=(f"I have the product with title {title} and following is a list of titles one by line, please check if my main title matches any of the other titles and return just and array with the indexes of the titles that match the main title.")
+# Retail products already in the database without any Amazon match, as the dicts the product pipeline takes
+def get_unmatched_products(session, source=None, limit=None):
+    from sqlalchemy import select
+    from app.models import Product, ProductMatch
 
-    # for amazon_title in amazon_titles:
-    #     prompt += f"\n{amazon_title}"
+    query = (
+        select(Product)
+        .outerjoin(ProductMatch, ProductMatch.product_id == Product.id)
+        .where(ProductMatch.id.is_(None), Product.in_stock == True)
+        .order_by(Product.id.desc())
+    )
+    if source is not None:
+        query = query.where(Product.source == source)
+    if limit is not None:
+        query = query.limit(limit)
 
-    # Prepare the message
-    message = [
+    return [
         {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": first_image_url}}
-            ]
+            'title': product.title,
+            'price': product.last_seen_price,
+            'image_urls': product.image_urls or [],
+            'product_url': product.product_url,
+            'source': product.source,
         }
+        for product in session.execute(query).scalars()
     ]
 
-    # Append each Amazon image URL to the message
-    for image_url in amazon_image_urls:
-        message[0]['content'].append({
-            "type": "image_url",
-            "image_url": {"url": image_url}
-        })
 
-    # print(f"message: {message}")
+# Cache, service and fetcher stats of a scrape or match run
+def log_run_stats():
+    from app.readiness import log_wait_stats
+    from app.retailers import ADAPTERS
 
-    # Send the request to the OpenAI API
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=message,
-        max_tokens=300,
-    )
+    log_wait_stats()
+    if amazon_search_cache:
+        logger.info(f"Amazon search cache: {amazon_search_cache.stats()}")
+    if match_verdict_cache:
+        logger.info(f"Match verdict cache: {match_verdict_cache.stats()}")
+    if matching_service:
+        logger.info(f"LLM matching service: {matching_service.stats()}")
+    for adapter in ADAPTERS.values():
+        if adapter.detail_fetcher:
+            logger.info(f"{adapter.source} detail fetcher: {adapter.detail_fetcher.stats()}")
 
-    message_content = response.choices[0].message.content.strip()
 
-    # Remove any backticks or unnecessary formatting around the JSON
-    if message_content.startswith("```") and message_content.endswith("```"):
-        message_content = message_content[3:-3].strip()
+# main.py scrape <retailer> [url ...]: scrape listing pages, search and match new products on Amazon
+def run_scrape(args):
+    from app.db import SessionLocal
+    from app.known_products import KnownProductIndex
+    from app.retailers import ADAPTERS
 
-    # If there's a "json" label, remove it
-    if message_content.startswith("json"):
-        message_content = message_content[4:].strip()
+    target_url_list = args.urls or DEFAULT_TARGET_URLS[args.retailer]
 
-    # Parse the JSON response from the assistant
-    try:
-        matching_indexes = json.loads(message_content)
-    except json.JSONDecodeError as e:
-        print(f"Failed to parse JSON: {e}")
-        matching_indexes = []
-
-    # print(matching_indexes)
-
-    return matching_indexes
-
-
-# Function to retrieve product URLs with their related Amazon product URLs
-def get_products_with_amazon_urls(session):
-    # Query products that are in stock and have at least one Amazon product match
-    products_with_amazon = session.query(Product).filter(
-        Product.in_stock == True,  # Filter by in_stock = True
-        Product.product_matches.any(and_(
-            ProductMatch.amazon_product.has(AmazonProduct.amazon_buy_box_count < 45),
-            ProductMatch.amazon_product.has(AmazonProduct.current_sellers > 2)
-        ))  # Filter AmazonProducts with amazon_buy_box_count < 45 and current_sellers > 2
-    ).options(
-        joinedload(Product.product_matches).joinedload(ProductMatch.amazon_product)
-    ).order_by(desc(Product.id)).all()
-
-    result = []
-
-    # Build the result list with the product URL and the associated Amazon URLs
-    for product in products_with_amazon:
-        product_data = {
-            'product_url': product.product_url,
-            'amazon_urls': [
-                match.amazon_product.product_url
-                for match in product.product_matches
-                if match.amazon_product and match.amazon_product.amazon_buy_box_count < 45 and match.amazon_product.current_sellers > 2
-            ]
-        }
-        result.append(product_data)
+    # The known products of the source are loaded once for the run and shared by the page workers
+    known_products = KnownProductIndex(SessionLocal, ADAPTERS[args.retailer].source).load()
 
-    return result
+    # Listing pages are scraped in parallel, each in its own tab, up to SCRAPE_WORKERS at a time
+    scrape_pages(
+        functools.partial(scrape_retailer_page, args.retailer, known_products=known_products),
+        target_url_list, workers=args.workers,
+    )
+    updated = known_products.flush()
+    if updated:
+        logger.info(f"Wrote {updated} remaining {args.retailer} product updates")
+    log_run_stats()
 
-# Function to scrape Sam's Club promotions using Selenium
-def scrape_samsclub_promotions_selenium(target_url):
-    # Initialize Selenium WebDriver with the existing Chrome session
-    chrome_options = Options()
-    chrome_options.debugger_address = "localhost:9222"  # Connect to running Chrome session
-    chrome_options.headless = False  # To see browser actions
 
-    driver = webdriver.Chrome(options=chrome_options)
+# main.py match: search and match the stored products that have no Amazon match yet
+def run_match(args):
+    from app.db import SessionLocal
+    from app.known_products import KnownProductIndex
 
-    # Open a new tab with Sam's Club URL
-    driver.execute_script(f"window.open('{target_url}', '_blank');")
-    driver.switch_to.window(driver.window_handles[-1])
-    print(f"Opened new Sam's Club tab: {driver.current_url}")
+    with SessionLocal() as session:
+        products = get_unmatched_products(session, source=args.source, limit=args.limit)
+    logger.info(f"Matching {len(products)} products without Amazon matches")
 
-    # Wait for the product container to load
-    try:
-        wait = WebDriverWait(driver, 30)  # Wait for up to 30 seconds
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'div.sc-plp-cards.sc-plp-cards-grid')))  # Adjust for Sam's Club
+    by_source = {}
+    for product in products:
+        by_source.setdefault(product['source'], []).append(product)
 
+    for source, source_products in by_source.items():
+        product_pipeline = build_product_pipeline(source, KnownProductIndex(SessionLocal, source))
+        for product in source_products:
+            product_pipeline.put(product)
+        product_pipeline.close()
 
-        # Get the page content after the JavaScript has loaded
-        content = driver.page_source
-        soup = BeautifulSoup(content, 'html.parser')
+    log_run_stats()
 
-        # Locate the product list container
-        products_list = soup.find_all('div', class_='sc-product-card')  # Adjust for Sam's Club
-        print(products_list)
-        exit()
 
-        # Check if products_list is found
-        if not products_list:
-            print("No products found on the page.")
-            return []
+# main.py enrich: set buy box and sellers of the Amazon products not analyzed yet
+def run_enrich(args):
+    from app.db import SessionLocal
 
-        walgreens_products = []
+    get_keepa_api()  # fail before paging through the products when the key is missing
+    with SessionLocal() as session:
+        analyze_and_update_products(session, workers=args.workers, batch_size=args.batch_size, page_size=args.page_size)
 
-        print(f"Found {len(products_list)} products on the page.")
 
-        for product in products_list:
-            try:
-                # Extract the product URL to navigate to the product details page
-                product_url = 'https://www.samsclub.com' + product.find('a', href=True)['href']
-
-                # Check if product URL is already in the database
-                session = SessionLocal()
-                existing_product = session.query(Product).filter_by(product_url=product_url).first()
-                session.close()
-
-                # Retry logic for loading the product details page
-                retries = 3
-                while retries > 0:
-                    try:
-                        # Open the product details page
-                        driver.get(product_url)
-                        wait = WebDriverWait(driver, 15)  # Set a 15-second timeout
-                        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'div.prod-price')))  # Wait for price element
-                        break  # Exit the retry loop if successful
-                    except Exception as e:
-                        retries -= 1
-                        print(f"Timeout reached for {product_url}. Retrying... {3 - retries} attempt(s) left.")
-                        if retries > 0:
-                            driver.refresh()  # Refresh the page and retry
-                        else:
-                            print(f"Failed to load product details page after 3 attempts. Skipping {product_url}.")
-                            continue  # Skip to the next product if retries are exhausted
-
-                # Get the page content for the product details page
-                product_content = driver.page_source
-                product_soup = BeautifulSoup(product_content, 'html.parser')
-
-                # Extract the full product name including the brand, title, and size from the h1 tag with class="sc-product-title"
-                product_name_h1 = product_soup.find('h1', class_='sc-product-title')
-                title = " ".join(product_name_h1.stripped_strings) if product_name_h1 else "No title found"
-
-                # Extract prices (regular price and sale price) and clean the result
-                regular_price_div = product_soup.find('span', class_='prod-price-old')
-                regular_price = regular_price_div.text.strip().replace('old price', '').strip() if regular_price_div else "No regular price"
-
-                sales_price_div = product_soup.find('span', class_='prod-price-primary')
-                sales_price = sales_price_div.text.strip().replace('Sale price', '').strip() if sales_price_div else "No sales price"
-
-                if existing_product:
-                    if existing_product.last_seen_price == sales_price:
-                        print(f"Product with URL {product_url} already exists and the price is the same seting as in stock.")
-                        existing_product.in_stock = True
-                        session = SessionLocal()
-                        session.add(existing_product)
-                        session.commit()
-                        session.close()
-                        continue
-                    print(f"Product with URL {product_url} already exists, updating the price.")
-                    existing_product.last_seen_price = sales_price
-                    existing_product.in_stock = True
-                    session = SessionLocal()
-                    session.add(existing_product)
-                    session.commit()
-                    session.close()
-                    continue
-
-                # Extract the image from the div
-                image_urls = []
-                image_div = product_soup.find('img', class_='sc-product-image')
-                if image_div:
-                    # Extract image URL from src attribute
-                    image_url = image_div['src']
-                    if image_url.startswith("//"):
-                        image_url = f"https:{image_url}"
-                    image_urls.append(image_url)
-
-                walgreens_product = {
-                    'title': title,
-                    'price': sales_price,
-                    'image_urls': image_urls,
-                    'product_url': product_url,
-                    'source': 'Sams Club'
-                }
-
-                print(f"Product: {title}\nPrice: {sales_price}\nProduct URL: {product_url}")
-
-                walgreens_products.append(walgreens_product)
-
-                # Perform Amazon search and return the first 10 results
-                amazon_results = search_amazon_with_selenium(walgreens_product)
-                matching_indexes = find_matching_amazon_images(walgreens_product, amazon_results)
-                matching_amazon = []
-
-                for matching_index in matching_indexes:
-                    try:
-                        # print(f"Matching Amazon url: {amazon_results[matching_index-1]['url']}")
-                        matching_amazon.append(amazon_results[matching_index-1])
-                        print(f"Amazon URL: {amazon_results[matching_index-1]['url']}")
-                    except IndexError:
-                        print(f"Index {matching_index} is out of range.")
-                        pass
-
-                insert_data_to_db(walgreens_product, matching_amazon)
-                print(f"Inserted product: {title}")
-                print(10 * '-')
-                time.sleep(3)
-            except Exception as e:
-                print(f"Error occurred while processing a product: {e}")
-                continue
+# main.py report: stream the flip opportunities as CSV or JSON, only needs SQLAlchemy
+def run_report(args):
+    from app.db import SessionLocal
+    from app.report import write_report
 
-        return walgreens_products
+    thresholds = {}
+    if args.max_buy_box_count is not None:
+        thresholds['max_buy_box_count'] = args.max_buy_box_count
+    if args.min_sellers is not None:
+        thresholds['min_sellers'] = args.min_sellers
 
-    except Exception as e:
-        print(f"Error occurred while scraping Sam's Club: {e}")
-        pass
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        with SessionLocal() as session:
+            count = write_report(session, out, fmt=args.format, **thresholds)
     finally:
-        # Close only the current tab
-        driver.close()
+        if out is not sys.stdout:
+            out.close()
+    logger.info(f"Wrote {count} products to {args.output}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Find retail products to flip on Amazon.")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    scrape = subcommands.add_parser('scrape', help="scrape retailer listing pages and match new products on Amazon")
+    scrape.add_argument('retailer', choices=sorted(DEFAULT_TARGET_URLS))
+    scrape.add_argument('urls', nargs='*', help="listing pages, defaults to the built-in list of the retailer")
+    scrape.add_argument('--workers', type=int, default=scrape_workers, help="listing pages scraped at once (SCRAPE_WORKERS)")
+    scrape.set_defaults(run=run_scrape)
+
+    enrich = subcommands.add_parser('enrich', help="fetch buy box and seller analytics from Keepa")
+    enrich.add_argument('--workers', type=int, default=4)
+    enrich.add_argument('--batch-size', type=int, default=KEEPA_MAX_BATCH)
+    enrich.add_argument('--page-size', type=int, default=1000)
+    enrich.set_defaults(run=run_enrich)
+
+    report = subcommands.add_parser('report', help="write the flip opportunities")
+    report.add_argument('--format', choices=['csv', 'json'], default='csv')
+    report.add_argument('--output', '-o', default='-', help="file to write, - for stdout")
+    report.add_argument('--max-buy-box-count', type=int, help="Amazon held the buy box on fewer days than this (default 45)")
+    report.add_argument('--min-sellers', type=int, help="more sellers than this on the listing (default 2)")
+    report.set_defaults(run=run_report)
+
+    match = subcommands.add_parser('match', help="search and match stored products that have no Amazon match")
+    match.add_argument('--source', help="only products of this source, e.g. 'walgreens' or 'Sams Club'")
+    match.add_argument('--limit', type=int)
+    match.set_defaults(run=run_match)
+
+    return parser
 
 
 # Main function to run the script
-async def main():
-    ### Print report
-    # session = SessionLocal()
-    # products_with_amazon_urls = get_products_with_amazon_urls(session)
-
-    # for item in products_with_amazon_urls:
-    #     print(f"Product URL: {item['product_url']}")
-    #     print(f"Amazon URLs: {', '.join(item['amazon_urls'])}")
-    #     print(10*'-')
-
-    ### Scrape walgreens
-    # target_url_list = [
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true",
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=72",
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=144",
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=216",
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=288",
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=360",
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=432",
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=504",
-    #     "https://www.walgreens.com/store/store/category/productlist.jsp?ban=dl_dlDMI_HeroREFRESH909_9082024_FlashSale_Ex20PO35&webExc=true&N=4294896499%2B1000023&Eon=4294896499&inStockOnly=true&No=576",
-    # ]
-    # for target_url in target_url_list:
-    #     scrape_walgreens_promotions_selenium(target_url)
-
-    ### Scrape samsclub
-    # target_url_list = [
-    #     "https://www.samsclub.com/savings?altQuery=1585&xid=plp_popcat_Health%20&%20Beauty_6",
-    # ]
-    # for target_url in target_url_list:
-    #     scrape_samsclub_promotions_selenium(target_url)
-
-    ### Scrape cvs
-    target_url_list = [
-        # "https://www.cvs.com/shop/merch/weekly-bogo-vitamins/q/Buy_1%2C_Get_1_Free/Buy_1%2C_Get_1_50%25_Off/Nature_Made/Nature's_Bounty/Nature's_Truth/Sundown_Naturals/Natures_Bounty/Natrol/Nature's_Way/Citracal/Nervive/Osteo_Bi-Flex/One_A_Day/Qunol/Natures_Way/Vicks_ZzzQuil/Airborne/Alive!/HumanN/Digestive_Advantage/Himalaya/Phillips'/Ester-C/Lisa_Frank/MiraLAX/Kappa_Books/Napz/Pure_ZZZs/Zarbee's/Vicks/Orgain/Tablets%2C_Capsules_%26_Caplets/Softgels/Chewables/Vegetarian_Tablets_%26_Capsules/Powder/Liquid/Oil/Lozenges/Dissolving_%2F_Meltaway_Tablets/prprbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrfmfmfmfmfmfmfmfmfm?widgetID=rj0r73j6&mc=cat2",
-        "https://www.cvs.com/shop/merch/weekly-bogo-vitamins/q/Buy_1%2C_Get_1_Free/Buy_1%2C_Get_1_50%25_Off/Nature_Made/Nature's_Bounty/Nature's_Truth/Sundown_Naturals/Natures_Bounty/Natrol/Nature's_Way/Citracal/Nervive/Osteo_Bi-Flex/One_A_Day/Qunol/Natures_Way/Vicks_ZzzQuil/Airborne/Alive!/HumanN/Digestive_Advantage/Himalaya/Phillips'/Ester-C/Lisa_Frank/MiraLAX/Kappa_Books/Napz/Pure_ZZZs/Zarbee's/Vicks/Orgain/Tablets%2C_Capsules_%26_Caplets/Softgels/Chewables/Vegetarian_Tablets_%26_Capsules/Powder/Liquid/Oil/Lozenges/Dissolving_%2F_Meltaway_Tablets/prprbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrbrfmfmfmfmfmfmfmfmfm?page=3&widgetID=rj0r73j6&mc=cat2"
-    ]
-    for target_url in target_url_list:
-        scrape_cvs_promotions_selenium(target_url)
-
-    ### Set buy box and sellers
-    # # OpenAI API Key (if still needed elsewhere in the script)
-    # openai.api_key = os.getenv("OPENAI_API_KEY")
-
-    # keepa_api_key = os.getenv('KEEPA_API')
-    # if not keepa_api_key:
-    #     logger.error("Keepa API key not found in environment variables. Set the 'KEEPA_API' environment variable.")
-    #     raise ValueError("Keepa API key not found in environment variables. Set the 'KEEPA_API' environment variable.")
-
-    # logger.debug("Initializing Keepa API with the provided key.")
-    # keepa_api = keepa.Keepa(keepa_api_key)
-    # session = SessionLocal()
-    # analyze_and_update_products(session)
-    
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from app.db import dispose_engine, init_schema
+
+    # Creates missing tables only when DB_CREATE_SCHEMA is set, run `alembic upgrade head` otherwise
+    init_schema()
+    try:
+        args.run(args)
+    finally:
+        dispose_engine()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()